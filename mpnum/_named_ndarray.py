@@ -10,6 +10,8 @@ Access as mpnum.named_ndarray.
 
 import numpy as np
 
+from .utils.extmath import tensordot
+
 
 class named_ndarray(object):
 
@@ -25,7 +27,8 @@ class named_ndarray(object):
     :method to_array(name_order): Return a ndarray with axis order
         specified by name_order.
     :method tensordot(other, axes): numpy.tensordot() with axis names
-        instead of axis indices
+        instead of axis indices (skips zero entries of mostly-zero arrays,
+        see :func:`mpnum.utils.extmath.tensordot`)
 
     """
 
@@ -91,8 +94,8 @@ class named_ndarray(object):
         axespos_other = [other.axispos(name) for name in axes_other]
         new_names = [name for name in self._axisnames if name not in axes_self]
         new_names += (name for name in other._axisnames if name not in axes_other)
-        array = np.tensordot(self._array, other._array,
-                             (axespos_self, axespos_other))
+        array = tensordot(self._array, other._array,
+                          (axespos_self, axespos_other))
         return named_ndarray(array, new_names)
 
     @property
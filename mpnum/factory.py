@@ -19,7 +19,7 @@ from .mpstruct import LocalTensors
 
 
 __all__ = ['eye', 'random_local_ham', 'random_mpa', 'random_mpdo',
-           'random_mps', 'random_mpo', 'zero', 'diagonal_mpa']
+           'random_mps', 'random_mpo', 'zero', 'diagonal_mpa', 'MPOBuilder']
 
 
 def _zrandn(shape, randstate=None):
@@ -409,6 +409,179 @@ def random_local_ham(sites, ldim=2, intlen=2, randstate=None):
     return mp.local_sum(local_hams)
 
 
+class MPOBuilder(object):
+    r"""Construct an MPO for a sum of products of local operators
+
+    Terms are added with :func:`add_term` and :func:`add_exp_decay`; the
+    MPO is returned by :func:`to_mpo`. The MPO is the transition matrix of a
+    finite state automaton [:ref:`Sch11 <Sch11>`, Sec. 6.1]: On each bond,
+    every term is either not yet started (all terms share one state), already
+    completed (ditto) or in progress. The left half of a term in progress is
+    identified by the factors to the left of the bond, the right half by the
+    factors to the right of the bond. Terms with a common prefix or suffix
+    therefore share states and the rank does not grow with the number of
+    terms per se. For example, the rank of a nearest-neighbour Hamiltonian
+    with :math:`k` two-site terms :math:`A \otimes B` per bond is
+    :math:`k + 2` if the :math:`A` differ, and the rank of a sum of
+    exponentially decaying two-site interactions is 3.
+
+    >>> pauli_z = np.diag([1., -1.])
+    >>> builder = MPOBuilder(5, 2)
+    >>> for i in range(4):
+    ...     builder.add_term((i, i + 1), (pauli_z, pauli_z), coeff=-1)
+    >>> builder.add_exp_decay(pauli_z, pauli_z, coeff=0.1, decay=0.5)
+    >>> builder.to_mpo().ranks
+    (3, 4, 4, 3)
+
+    :param nr_sites: Number of sites
+    :param ldim: Local dimension; either an integer or a sequence with one
+        entry per site
+
+    """
+
+    def __init__(self, nr_sites, ldim):
+        self._nr_sites = nr_sites
+        self._ldims = tuple(ldim) if isinstance(ldim, collections.Iterable) \
+            else (ldim,) * nr_sites
+        assert len(self._ldims) == nr_sites
+        # _ops[i] is the local operator with operator key i
+        self._ops = []
+        self._opkeys = {}
+        # _edges[site] maps (left state, right state) to a list
+        # [operator, summed]; `summed` is False if all contributions are
+        # equal and must not be added up
+        self._edges = [collections.OrderedDict() for _ in range(nr_sites)]
+        self._max_start = -1
+        self._min_end = nr_sites
+        self._dtypes = [np.float_]
+
+    def _opkey(self, op):
+        op = np.asarray(op)
+        key = (op.shape, op.dtype.str, op.tobytes())
+        if key not in self._opkeys:
+            self._opkeys[key] = len(self._ops)
+            self._ops.append(op)
+            self._dtypes.append(op.dtype)
+        return self._opkeys[key]
+
+    def _add_edge(self, site, left, right, op, summed):
+        edge = self._edges[site].get((left, right))
+        if edge is None:
+            self._edges[site][left, right] = [op, summed]
+        elif summed:
+            assert edge[1], "Conflicting automaton transitions"
+            edge[0] = edge[0] + op
+        self._max_start = max(self._max_start, site if left == 'idle' else -1)
+        self._min_end = min(self._min_end,
+                            site if right == 'done' else self._nr_sites)
+
+    def add_term(self, sites, ops, coeff=1):
+        """Add the term ``coeff * ops[0] ⊗ ops[1] ⊗ ...`` which acts as
+        ``ops[i]`` on site ``sites[i]`` (and as identity everywhere else)
+
+        :param sites: Strictly increasing sequence of site indices
+        :param ops: Sequence of square matrices, the local operators
+        :param coeff: Scalar coefficient of the term (default 1)
+
+        """
+        sites = tuple(sites)
+        assert len(sites) == len(ops) > 0
+        assert all(s < t for s, t in zip(sites[:-1], sites[1:])), \
+            "sites must be strictly increasing: {}".format(sites)
+        assert 0 <= sites[0] and sites[-1] < self._nr_sites
+        assert all(np.shape(op) == (self._ldims[site],) * 2
+                   for site, op in zip(sites, ops))
+        self._dtypes.append(np.asarray(coeff).dtype)
+        factors = tuple(zip(sites, (self._opkey(op) for op in ops)))
+        # Left of the bond to the right of site `sites[split]`, the state
+        # is given by the factors on the left; right of it by the
+        # factors on the right. The coefficient is placed on `sites[split]`.
+        split = len(sites) // 2
+
+        def state(bond):
+            if bond <= sites[0]:
+                return 'idle'
+            elif bond > sites[-1]:
+                return 'done'
+            elif bond <= sites[split]:
+                return ('L',) + tuple(f for f in factors if f[0] < bond)
+            return ('R',) + tuple(f for f in factors if f[0] >= bond)
+
+        opkeys = dict(factors)
+        for site in range(sites[0], sites[-1] + 1):
+            if site in opkeys:
+                op = self._ops[opkeys[site]]
+            else:
+                op = np.eye(self._ldims[site])
+            if site == sites[split]:
+                self._add_edge(site, state(site), state(site + 1),
+                               coeff * op, summed=True)
+            else:
+                self._add_edge(site, state(site), state(site + 1), op,
+                               summed=False)
+
+    def add_exp_decay(self, op_a, op_b, coeff=1, decay=1.):
+        r"""Add the terms :math:`c \sum_{i < j} \lambda^{j - i - 1} A_i B_j`
+
+        :param op_a: Local operator :math:`A` (square matrix)
+        :param op_b: Local operator :math:`B` (square matrix)
+        :param coeff: Coefficient :math:`c` (default 1)
+        :param decay: Decay factor :math:`\lambda` (default 1)
+
+        """
+        assert len(set(self._ldims)) == 1, \
+            "add_exp_decay() requires equal local dimensions"
+        self._dtypes.append(np.asarray(coeff * decay).dtype)
+        state = ('E', self._opkey(op_a), decay)
+        self._opkey(op_b)
+        ident = np.eye(self._ldims[0])
+        for site in range(self._nr_sites - 1):
+            self._add_edge(site, 'idle', state, np.asarray(op_a), summed=False)
+            if site > 0:
+                self._add_edge(site, state, state, decay * ident, summed=False)
+        for site in range(1, self._nr_sites):
+            self._add_edge(site, state, 'done', coeff * np.asarray(op_b),
+                           summed=True)
+
+    def to_mpo(self):
+        """Return the sum of all terms added so far as MPO
+
+        :returns: :class:`~mpnum.mparray.MPArray` with two physical legs
+
+        """
+        assert self._max_start >= 0, "No terms have been added"
+        for site in range(self._nr_sites):
+            ident = np.eye(self._ldims[site])
+            if site < self._max_start:
+                self._add_edge(site, 'idle', 'idle', ident, summed=False)
+            if site > self._min_end:
+                self._add_edge(site, 'done', 'done', ident, summed=False)
+
+        # The states on each bond, 'idle' first and 'done' last
+        bonds = [[] for _ in range(self._nr_sites + 1)]
+        for site, edges in enumerate(self._edges):
+            for left, right in edges:
+                for bond, state in ((site, left), (site + 1, right)):
+                    if state not in bonds[bond]:
+                        bonds[bond].append(state)
+        order = {'idle': -1, 'done': 1}
+        bonds = [{state: i for i, state in enumerate(
+                  sorted(states, key=lambda s: order.get(s, 0)))}
+                 for states in bonds]
+        assert len(bonds[0]) == len(bonds[-1]) == 1
+
+        dtype = np.result_type(*self._dtypes)
+        ltens = []
+        for site, edges in enumerate(self._edges):
+            ldim = self._ldims[site]
+            lten = np.zeros((len(bonds[site]), ldim, ldim,
+                             len(bonds[site + 1])), dtype=dtype)
+            for (left, right), (op, _) in edges.items():
+                lten[bonds[site][left], ..., bonds[site + 1][right]] = op
+            ltens.append(lten)
+        return mp.MPArray(ltens)
+
+
 def _unitary_haar(dim, randstate=None):
     """Returns a sample from the Haar measure of the unitary group of given
     dimension.
@@ -24,17 +24,19 @@ import mpnum as mp
 import numpy as np
 from numpy.linalg import qr, svd
 from numpy.testing import assert_array_equal
+from scipy.linalg import qr as scipy_qr
 from six.moves import range, zip, zip_longest
 
 from ._named_ndarray import named_ndarray
 from .mpstruct import LocalTensors
-from .utils import (block_diag, global_to_local, local_to_global, matdot,
-                    truncated_svd)
+from .utils import (SVD_BACKENDS, block_diag, global_to_local,
+                    local_to_global, matdot, tensordot, truncated_svd)
 
 __all__ = ['MPArray', 'dot', 'inject', 'inner', 'local_sum', 'localouter',
            'norm', 'normdist', 'chain', 'partialdot', 'partialtrace',
            'prune', 'regular_slices', 'sandwich', 'embed_slice',
-           'trace', 'diag', 'sumup', 'full_rank']
+           'trace', 'diag', 'sumup', 'full_rank', 'local_sum_compression',
+           'entanglement_profile']
 
 
 class MPArray(object):
@@ -589,7 +591,7 @@ class MPArray(object):
     ################################
     #  Normalizaton & Compression  #
     ################################
-    def canonicalize(self, left=None, right=None):
+    def canonicalize(self, left=None, right=None, tol=None):
         """Brings the MPA to canonical form in place
         [:ref:`Sch11 <Sch11>`, Sec. 4.4]
 
@@ -639,13 +641,27 @@ class MPArray(object):
 
         - Matrix would be both left- and right-normalized: ``ValueError``
 
+        If ``tol`` is given, a column-pivoted (rank-revealing) QR
+        decomposition is used instead of the plain one and all rows of
+        :math:`R` whose diagonal element is smaller than ``tol`` times the
+        largest one are discarded. This reduces the ranks of the
+        canonicalized bonds to their numerical rank, e.g. for sums of MPAs or
+        for MPOs from :func:`local_sum`, without an SVD. Note that a
+        single sweep only takes into account the part of the chain which has
+        been swept over already; use e.g. ``canonicalize(left='afull',
+        tol=tol)`` followed by ``canonicalize(right='afull', tol=tol)`` to
+        reduce all ranks. Bonds which are canonical already are not touched.
+
+        :param tol: Relative tolerance for the rank truncation, e.g.
+            ``1e-12``. (default: ``None``, i.e. no truncation)
+
         """
         current_lcanon, current_rcanon = self.canonical_form
         if left is None and right is None:
             if current_lcanon < len(self) - current_rcanon:
-                self._lcanonicalize(1)
+                self._lcanonicalize(1, tol)
             else:
-                self._rcanonicalize(len(self) - 1)
+                self._rcanonicalize(len(self) - 1, tol)
             return
 
         # Fill the special values for `None` and 'afull'.
@@ -666,15 +682,16 @@ class MPArray(object):
             raise ValueError("Canonicalization {}:{} invalid"
                              .format(target_lcanon, target_rcanon))
         if current_lcanon < target_lcanon:
-            self._rcanonicalize(target_lcanon)
+            self._rcanonicalize(target_lcanon, tol)
         if current_rcanon > target_rcanon:
-            self._lcanonicalize(target_rcanon)
+            self._lcanonicalize(target_rcanon, tol)
 
-    def _rcanonicalize(self, to_site):
+    def _rcanonicalize(self, to_site, tol=None):
         """Left-canonicalizes all local tensors _ltens[:to_site] in place
 
         :param to_site: Index of the site up to which canonicalization is to be
             performed
+        :param tol: See :func:`canonicalize`
 
         """
         assert 0 <= to_site < len(self), 'to_site={!r}'.format(to_site)
@@ -682,19 +699,20 @@ class MPArray(object):
         lcanon, rcanon = self._lt.canonical_form
         for site in range(lcanon, to_site):
             ltens = self._lt[site]
-            q, r = qr(ltens.reshape((-1, ltens.shape[-1])))
-            # if ltens.shape[-1] > prod(ltens.phys_shape) --> trivial comp.
-            # can be accounted by adapting rank here
+            # reduced QR: if ltens.shape[-1] > prod(ltens.shape[:-1]), the
+            # rank is reduced trivially
+            q, r = _qr(ltens.reshape((-1, ltens.shape[-1])), tol)
             newtens = (q.reshape(ltens.shape[:-1] + (-1,)),
                        matdot(r, self._lt[site + 1]))
             self._lt.update(slice(site, site + 2), newtens,
                             canonicalization=('left', None))
 
-    def _lcanonicalize(self, to_site):
+    def _lcanonicalize(self, to_site, tol=None):
         """Right-canonicalizes all local tensors _ltens[to_site:] in place
 
         :param to_site: Index of the site up to which canonicalization is to be
             performed
+        :param tol: See :func:`canonicalize`
 
         """
         assert 0 < to_site <= len(self), 'to_site={!r}'.format(to_site)
@@ -702,9 +720,9 @@ class MPArray(object):
         lcanon, rcanon = self.canonical_form
         for site in range(rcanon - 1, to_site - 1, -1):
             ltens = self._lt[site]
-            q, r = qr(ltens.reshape((ltens.shape[0], -1)).T)
-            # if ltens.shape[-1] > prod(ltens.phys_shape) --> trivial comp.
-            # can be accounted by adapting rank here
+            # reduced QR: if ltens.shape[0] > prod(ltens.shape[1:]), the
+            # rank is reduced trivially
+            q, r = _qr(ltens.reshape((ltens.shape[0], -1)).T, tol)
             newtens = (matdot(self._lt[site - 1], r.T),
                        q.T.reshape((-1,) + ltens.shape[1:]))
             self._lt.update(slice(site - 1, site + 1), newtens,
@@ -773,7 +791,17 @@ class MPArray(object):
             default choice. In some circumstances, a partial SVD as provided
             by :func:`scipy.sparse.linalg.svds()` or a randomized SVD such as
             :func:`~.utils.extmath.randomized_svd()` might speed up
-            computations with no or little loss of accuracy.
+            computations with no or little loss of accuracy. Can also be
+            one of the names in :data:`~.utils.extmath.SVD_BACKENDS`, e.g.
+            ``'auto'`` to choose between a dense and a randomized SVD on each
+            site separately. Only used if ``relerr`` is not given.
+
+        :param sketches: A dict used to warm-start the SVDs from a previous
+            compression of a similar MPA (e.g. in a time evolution). The
+            right singular vectors of each site are stored in it and passed
+            as ``sketch`` to ``svdfunc`` in the next call, which therefore
+            must support this keyword (``'randomized'`` and ``'auto'`` do).
+            (default: ``None``)
 
         .. rubric:: Parameters for ``'var'``:
 
@@ -828,12 +856,18 @@ class MPArray(object):
             raise ValueError('{!r} is not a valid method'.format(method))
 
     def _compress_svd(self, rank=None, relerr=None, direction=None,
-                      canonicalize=True, svdfunc=truncated_svd):
+                      canonicalize=True, svdfunc=truncated_svd, sketches=None):
         """Compress `self` using SVD [:ref:`Sch11 <Sch11>`, Sec. 4.5.1]
 
         Parameters: See :func:`~compress()`.
 
         """
+        if not callable(svdfunc):
+            try:
+                svdfunc = SVD_BACKENDS[svdfunc]
+            except KeyError:
+                raise ValueError('{!r} is not a valid svdfunc'.format(svdfunc))
+
         if len(self) == 1:
             # Cannot do anything. Return perfect overlap.
             return norm(self)**2
@@ -846,13 +880,13 @@ class MPArray(object):
         if direction == 'right':
             if canonicalize:
                 self.canonicalize(right=1)
-            for item in self._compress_svd_r(rank, relerr, svdfunc):
+            for item in self._compress_svd_r(rank, relerr, svdfunc, sketches):
                 pass
             return item
         elif direction == 'left':
             if canonicalize:
                 self.canonicalize(left=len(self) - 1)
-            for item in self._compress_svd_l(rank, relerr, svdfunc):
+            for item in self._compress_svd_l(rank, relerr, svdfunc, sketches):
                 pass
             return item
 
@@ -898,7 +932,7 @@ class MPArray(object):
         compr = compr.reshape(shape)
         return compr, overlap
 
-    def _compress_svd_l(self, rank, relerr, svdfunc):
+    def _compress_svd_l(self, rank, relerr, svdfunc, sketches=None):
         """Compresses the MPA in place from right to left using SVD;
         yields a right-canonical state
 
@@ -913,10 +947,11 @@ class MPArray(object):
             ltens = self._lt[site]
             matshape = (ltens.shape[0], -1)
             if relerr is None:
-                u, sv, v = svdfunc(ltens.reshape(matshape), rank)
+                u, sv, v = self._svd_sketched(ltens.reshape(matshape), rank,
+                                              svdfunc, sketches, ('left', site))
                 rank_t = len(sv)
             else:
-                u, sv, v = svd(ltens.reshape(matshape))
+                u, sv, v = svd(ltens.reshape(matshape), full_matrices=False)
                 svsum = np.cumsum(sv) / np.sum(sv)
                 rank_relerr = np.searchsorted(svsum, 1 - relerr) + 1
                 rank_t = min(ltens.shape[0], v.shape[0], rank, rank_relerr)
@@ -930,7 +965,7 @@ class MPArray(object):
 
         yield np.sum(np.abs(self._lt[0])**2)
 
-    def _compress_svd_r(self, rank, relerr, svdfunc):
+    def _compress_svd_r(self, rank, relerr, svdfunc, sketches=None):
         """Compresses the MPA in place from left to right using SVD;
         yields a left-canonical state
 
@@ -944,10 +979,11 @@ class MPArray(object):
             ltens = self._lt[site]
             matshape = (-1, ltens.shape[-1])
             if relerr is None:
-                u, sv, v = svdfunc(ltens.reshape(matshape), rank)
+                u, sv, v = self._svd_sketched(ltens.reshape(matshape), rank,
+                                              svdfunc, sketches, ('right', site))
                 rank_t = len(sv)
             else:
-                u, sv, v = svd(ltens.reshape(matshape))
+                u, sv, v = svd(ltens.reshape(matshape), full_matrices=False)
                 svsum = np.cumsum(sv) / np.sum(sv)
                 rank_relerr = np.searchsorted(svsum, 1 - relerr) + 1
                 rank_t = min(ltens.shape[-1], u.shape[1], rank, rank_relerr)
@@ -961,6 +997,16 @@ class MPArray(object):
 
         yield np.sum(np.abs(self._lt[-1])**2)
 
+    @staticmethod
+    def _svd_sketched(mat, rank, svdfunc, sketches, key):
+        """Calls ``svdfunc(mat, rank)``, warm-started from and updating
+        ``sketches[key]`` if ``sketches`` is not None"""
+        if sketches is None:
+            return svdfunc(mat, rank)
+        u, sv, v = svdfunc(mat, rank, sketch=sketches.get(key))
+        sketches[key] = v.conj().T
+        return u, sv, v
+
     def singularvals(self):
         """Return singular values of ``self`` for all bipartitions
 
@@ -969,7 +1015,8 @@ class MPArray(object):
             singular values for each bipartition.
 
         .. note:: May decrease the rank (without changing the represented
-            tensor).
+            tensor). Use :func:`entanglement_profile` to obtain entropies
+            or Schmidt coefficients without modifying ``self``.
 
         """
         if len(self) == 1:
@@ -1775,9 +1822,139 @@ def local_sum(mpas, embed_tensor=None, length=None, slices=None):
     return sumup(mpas)
 
 
+def local_sum_compression(mpa, relerr=1e-12, rank=None, direction=None,
+                          embed_tensor=None):
+    """Compress a sum of local terms embedded with identities (e.g. a
+    Hamiltonian from :func:`local_sum`) to its minimal rank
+
+    Canonicalizing or compressing such an MPO directly leads to
+    exponentially large tensor entries since the embedding identities have
+    Frobenius norm larger than one (see
+    :func:`mpnum.utils.physics.mpo_cH`). Here, we divide each local tensor
+    by the Frobenius norm of the embedding tensor, compress the result using
+    SVD and multiply the local tensors by the same factors again. All
+    singular values are then of polynomial size in the length of the chain
+    and the rank of the result is the minimal rank which represents ``mpa``
+    up to ``relerr``.
+
+    :param mpa: MPA to compress, not modified
+    :param relerr: Passed to :func:`MPArray.compress` (default ``1e-12``,
+        i.e. discard numerically vanishing singular values only)
+    :param rank: Passed to :func:`MPArray.compress` (default ``None``)
+    :param direction: Passed to :func:`MPArray.compress` (default ``None``)
+    :param embed_tensor: Defaults to square identity matrix (see
+        :func:`_embed_ltens_identity` for details)
+    :returns: The compressed MPA
+
+    """
+    if embed_tensor is None:
+        assert all(len(dims) == 2 and dims[0] == dims[1] for dims in mpa.shape), \
+            "For ndims != 2 or non-square shape, you must supply a tensor"
+        scales = [np.sqrt(dims[0]) for dims in mpa.shape]
+    else:
+        scales = [np.linalg.norm(embed_tensor)] * len(mpa)
+
+    compr = MPArray([lt / scale for lt, scale in zip(mpa.lt, scales)])
+    compr.compress(method='svd', relerr=relerr, rank=rank, direction=direction)
+    return MPArray([lt * scale for lt, scale in zip(compr.lt, scales)])
+
+
+def _renyi_entropy(schmidt, alpha):
+    """Renyi entropy (natural logarithm) of normalized Schmidt coefficients"""
+    p = schmidt[schmidt > 0]**2
+    if alpha == 1:
+        return -np.sum(p * np.log(p))
+    elif alpha == np.inf:
+        return -np.log(p[0])
+    return np.log(np.sum(p**alpha)) / (1 - alpha)
+
+
+def entanglement_profile(mpa, which='all', renyi=1, spectra=None):
+    r"""Entanglement entropies of the bipartitions of an MPS
+
+    The Schmidt coefficients of the bipartition between sites ``bond``
+    and ``bond + 1`` are the singular values of the bond matrix obtained
+    from a QR decomposition of the orthogonality center. The orthogonality
+    center is moved once in a left-to-right sweep over the requested bonds,
+    such that only a small SVD per bond is necessary.
+
+    In contrast to :func:`MPArray.singularvals`, ``mpa`` is not modified
+    (the sweep works on a shallow copy).
+
+    :param mpa: MPS (or other MPA, the physical legs of each site are
+        treated as one index)
+    :param which: ``'all'`` or an iterable of bonds, where bond ``b``
+        separates the sites ``[0, b]`` and ``[b + 1, len(mpa))``
+        (default: ``'all'``)
+    :param renyi: Order :math:`\alpha` of the Renyi entropy :math:`S_\alpha
+        = \log(\sum_k p_k^\alpha) / (1 - \alpha)`; ``1`` is the von Neumann
+        entropy and ``np.inf`` the min-entropy (default: ``1``). Entropies
+        use the natural logarithm.
+    :param spectra: If not ``None``, also return the largest ``spectra``
+        Schmidt coefficients of each bond (default: ``None``)
+    :returns: Array of entropies for the requested bonds (in ascending
+        order) or ``(entropies, schmidt)`` if ``spectra`` is given, where
+        ``schmidt`` has shape ``(len(entropies), spectra)`` and contains
+        normalized Schmidt coefficients in descending order (padded with
+        zeros)
+
+    >>> import mpnum as mp
+    >>> bell = mp.MPArray.from_array(np.array([1, 0, 0, 1]).reshape((2, 2)))
+    >>> ent, schmidt = mp.entanglement_profile(bell, spectra=3)
+    >>> np.allclose(ent, np.log(2)), np.allclose(schmidt, [[.5**.5] * 2 + [0]])
+    (True, True)
+
+    """
+    n_bonds = len(mpa) - 1
+    bonds = range(n_bonds) if which == 'all' else sorted(set(which))
+    assert all(0 <= bond < n_bonds for bond in bonds), \
+        "Invalid bonds {} for {} sites".format(which, len(mpa))
+    entropies = np.zeros(len(bonds))
+    schmidt = np.zeros((len(bonds), spectra or 0))
+    if len(bonds) == 0:
+        return entropies if spectra is None else (entropies, schmidt)
+
+    work = MPArray(LocalTensors(mpa.lt, cform=mpa.canonical_form))
+    work.canonicalize(left=bonds[0], right=bonds[0] + 1)
+    ltens = work.lt
+    center = ltens[bonds[0]]
+    pos = 0
+    for site in range(bonds[0], bonds[-1] + 1):
+        _, r = qr(center.reshape((-1, center.shape[-1])))
+        if site == bonds[pos]:
+            sv = svd(r, compute_uv=False)
+            sv = sv / np.linalg.norm(sv)
+            entropies[pos] = _renyi_entropy(sv, renyi)
+            num = min(len(sv), schmidt.shape[1])
+            schmidt[pos, :num] = sv[:num]
+            pos += 1
+        center = matdot(r, ltens[site + 1])
+    return entropies if spectra is None else (entropies, schmidt)
+
+
 ############################################################
 #  Functions for dealing with local operations on tensors  #
 ############################################################
+def _qr(A, tol=None):
+    """Reduced QR decomposition ``A = q.dot(r)``
+
+    :param A: Matrix
+    :param tol: If not ``None``, use a column-pivoted QR decomposition and
+        discard all (but at least one) columns of `q` and rows of `r` which
+        belong to diagonal elements of `r` smaller than ``tol`` times the
+        largest one
+    :returns: ``q, r`` with ``q`` an isometry
+
+    """
+    if tol is None:
+        return qr(A)
+    q, r, perm = scipy_qr(A, mode='economic', pivoting=True)
+    diag = np.abs(np.diagonal(r))
+    rank = max(1, np.count_nonzero(diag > tol * diag[0]))
+    r = r[:rank, np.argsort(perm)]
+    return q[:, :rank], r
+
+
 def _extract_factors(tens, ndims):
     """Extract iteratively the leftmost MPO tensor with given number of
     legs by a qr-decomposition
@@ -1815,13 +1992,16 @@ def _local_dot(ltens_l, ltens_r, axes):
         (and not the just the physical) legs of the local tensors
     :returns: Correct local tensor representation
 
+    Zero entries of mostly-zero local tensors (e.g. of Hamiltonian MPOs) are
+    skipped, see :func:`~mpnum.utils.extmath.tensordot`.
+
     """
     # number of contracted legs need to be the same
     clegs_l = len(axes[0]) if isinstance(axes[0], collections.Sequence) else 1
     clegs_r = len(axes[1]) if isinstance(axes[0], collections.Sequence) else 1
     assert clegs_l == clegs_r, \
         "Number of contracted legs differ: {} != {}".format(clegs_l, clegs_r)
-    res = np.tensordot(ltens_l, ltens_r, axes=axes)
+    res = tensordot(ltens_l, ltens_r, axes=axes)
     # Rearrange the virtual-dimension legs
     res = np.rollaxis(res, ltens_l.ndim - clegs_l, 1)
     res = np.rollaxis(res, ltens_l.ndim - clegs_l,
@@ -124,19 +124,69 @@ References:
 
 from __future__ import absolute_import, division, print_function
 
+import itertools as it
+
 import numpy as np
 from numpy.testing import assert_array_equal
 
-from six.moves import range
+from six.moves import map, range
 
 from . import mparray as mp
+from .mpstruct import LocalTensors
 from .utils import local_to_global, matdot
 
 
-__all__ = ['mps_to_mpo', 'mps_to_pmps', 'pmps_dm_to_array',
-           'pmps_reduction', 'pmps_to_mpo', 'pmps_to_mps',
-           'reductions_mpo', 'reductions_mps_as_mpo',
-           'reductions_mps_as_pmps', 'reductions_pmps', 'reductions']
+__all__ = ['PMPS', 'correlation_matrix', 'local_expectations',
+           'mps_to_mpo', 'mps_to_pmps', 'pmps_dm_to_array', 'pmps_reduction',
+           'pmps_to_mpo', 'pmps_to_mps', 'reduction_mpo', 'reductions_mpo',
+           'reductions_mps_as_mpo', 'reductions_mps_as_pmps',
+           'reductions_pmps', 'reductions']
+
+
+def _imap(func, *iterables, **kwargs):
+    """Same as :code:`map(func, *iterables)`, but optionally parallel
+
+    :param executor: A :class:`concurrent.futures.Executor` (e.g. a thread or
+        process pool) used to evaluate ``func``. (default: ``None``)
+    :param n_workers: If ``executor`` is not given and ``n_workers > 1``,
+        a :class:`concurrent.futures.ThreadPoolExecutor` with ``n_workers``
+        threads is used (a :class:`multiprocessing.pool.ThreadPool` if
+        :mod:`concurrent.futures` is not available). (default: ``None``)
+    :returns: Iterator over the results in the order of the arguments
+
+    Thread pools are useful because numpy releases the GIL during most
+    of the computations on larger arrays. ``func`` and its arguments must be
+    picklable if a process pool is used.
+
+    """
+    executor = kwargs.pop('executor', None)
+    n_workers = kwargs.pop('n_workers', None)
+    assert not kwargs, "Unexpected arguments: {}".format(kwargs)
+    if executor is not None:
+        return executor.map(func, *iterables)
+    if n_workers is None or n_workers <= 1:
+        return map(func, *iterables)
+    return _imap_threads(func, iterables, n_workers)
+
+
+def _imap_threads(func, iterables, n_workers):
+    try:
+        from concurrent.futures import ThreadPoolExecutor
+    except ImportError:
+        # Python 2 without the ``futures`` backport
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(n_workers)
+        try:
+            for result in pool.imap(lambda args: func(*args),
+                                    zip(*iterables)):
+                yield result
+        finally:
+            pool.terminate()
+        return
+
+    with ThreadPoolExecutor(n_workers) as executor:
+        for result in executor.map(func, *iterables):
+            yield result
 
 
 def _check_reductions_args(nr_sites, width, startsites, stopsites):
@@ -158,6 +208,50 @@ def _check_reductions_args(nr_sites, width, startsites, stopsites):
     return startsites, stopsites
 
 
+def _pmps_dm_left(ltens):
+    """Contract the density matrix of the sites ``ltens`` from the left
+
+    :returns: Array with axes ``(phys, lower rank, upper rank)``, where
+        the physical axis is in local form (i.e. row and column index of
+        the first site, row and column index of the second site, ...)
+
+    """
+    out = np.ones((1, 1, 1))
+    for lt in ltens:
+        rank_l, ldim, adim, rank_r = lt.shape
+        nr_phys, rank_lc = out.shape[:2]
+        out = np.dot(out.reshape((-1, rank_l)), lt.reshape((rank_l, -1)))
+        # Axes: 0 phys, 1 lower rank, 2 phys, 3 anc, 4 upper rank
+        out = out.reshape((nr_phys, rank_lc, ldim, adim, rank_r)) \
+            .transpose(0, 2, 4, 1, 3)
+        # Axes: 0 phys, 1 phys, 2 upper rank, 3 lower rank, 4 anc
+        ltc = lt.conj().transpose(0, 2, 1, 3).reshape((rank_l * adim, -1))
+        out = np.dot(out.reshape((-1, rank_lc * adim)), ltc)
+        # Axes: 0 phys, 1 phys, 2 upper rank, 3 phys, 4 lower rank
+        out = out.reshape((nr_phys, ldim, rank_r, ldim, rank_r)) \
+            .transpose(0, 1, 3, 4, 2)
+        out = out.reshape((-1, rank_r, rank_r))
+    return out
+
+
+def _pmps_dm_split(pmps):
+    """Number of sites contracted from the left in :func:`pmps_dm_to_array`
+
+    Choose the split such that the largest intermediate result of both
+    halves is minimal (cf. :func:`MPPovm._pmf_as_array_pmps_symm()
+    <mpnum.povm.mppovm.MPPovm._pmf_as_array_pmps_symm>`).
+
+    """
+    if len(pmps) == 1:
+        return 1
+    cp = np.cumprod([dims[0]**2 for dims in pmps.shape], dtype=int)
+    size = np.array([cp[:-1], cp[-1] // cp[:-1]])
+    size *= np.array(pmps.ranks, dtype=int)[None, :]**2
+    size_max = [max(it.chain(size[0, :i + 1], size[1, i:]))
+                for i in range(size.shape[1])]
+    return int(np.argmin(size_max)) + 1
+
+
 def pmps_dm_to_array(pmps, global_=False):
     """Convert PMPS to full array representation of the density matrix
 
@@ -168,20 +262,32 @@ def pmps_dm_to_array(pmps, global_=False):
     :func:`pmps_to_mpo` may not be sufficient to reduce the rank
     in that case.
 
+    The chain is contracted from both ends up to a split point chosen
+    such that the largest intermediate result is minimal. The two halves
+    are then multiplied into a preallocated output array, so that the
+    peak memory is dominated by the result itself.
+
     .. note:: The resulting array will have dimension-1 physical legs removed.
 
     """
-    out = np.ones((1, 1, 1))
-    # Axes: 0 phys, 1 upper rank, 2 lower rank
-    for lt in pmps.lt:
-        out = np.tensordot(out, lt, axes=(1, 0))
-        # Axes: 0 phys, 1 lower rank, 2 phys, 3 anc, 4 upper rank
-        out = np.tensordot(out, lt.conj(), axes=((1, 3), (0, 2)))
-        # Axes: 0 phys, 1 phys, 2 upper rank, 3 phys, 4 lower rank
-        out = np.rollaxis(out, 3, 2)
-        # Axes: 0 phys, 1 phys, 2 phys, 3 upper bound, 4 lower rank
-        out = out.reshape((-1, out.shape[3], out.shape[4]))
-        # Axes: 0 phys, 1 upper rank, 2 lower rank
+    n_left = _pmps_dm_split(pmps)
+    left = _pmps_dm_left(pmps.lt[:n_left])
+    left = left.reshape((left.shape[0], -1))
+    # Axes: 0 phys, 1 (lower rank, upper rank)
+    right = _pmps_dm_left(lt.transpose(3, 1, 2, 0)
+                          for lt in pmps.lt[:n_left - 1:-1])
+    # Sites (and thus physical axes) are in reverse order in `right`
+    dims_right = [dims[0] for dims in pmps.shape[n_left:]]
+    right = right.reshape([d for d in dims_right[::-1] for _ in (0, 1)] + [-1])
+    nr_right = len(dims_right)
+    axes = [2 * nr_right] + [2 * (nr_right - 1 - pos) + k
+                             for pos in range(nr_right) for k in (0, 1)]
+    right = right.transpose(axes).reshape((left.shape[1], -1))
+    # Axes: 0 (lower rank, upper rank), 1 phys
+    out = np.empty((left.shape[0], right.shape[1]),
+                   dtype=np.result_type(left, right))
+    np.dot(left, right, out=out)
+
     out_shape = [dim for dim, _ in pmps.shape for rep in (1, 2) if dim > 1]
     out = out.reshape(out_shape)
     if global_:
@@ -218,7 +324,333 @@ def pmps_reduction(pmps, support):
     )
 
 
-def reductions_mpo(mpa, width=None, startsites=None, stopsites=None):
+def _apply_local(op, lt):
+    """Multiply the first physical leg of ``lt`` by the matrix ``op``"""
+    return np.moveaxis(np.tensordot(op, lt, axes=(1, 1)), 0, 1)
+
+
+def _transfer_apply(bond, lt, mode, op=None):
+    """Trace out one site from the right bond of ``bond``
+
+    ``bond`` has axes ``(x, upper rank, lower rank)`` for ``mode ==
+    'pmps'`` and ``(x, rank)`` for ``mode == 'mpdo'``. If ``op`` is
+    given, the site is traced out after multiplying its density matrix
+    by ``op`` from the left.
+
+    """
+    ket = lt if op is None else _apply_local(op, lt)
+    if mode == 'pmps':
+        out = np.tensordot(bond, ket, axes=(1, 0))
+        # Axes: 0 x, 1 lower rank, 2 phys, 3 anc, 4 upper rank
+        return np.tensordot(out, lt.conj(), axes=((1, 2, 3), (0, 1, 2)))
+    return np.tensordot(bond, np.trace(ket, axis1=1, axis2=2), axes=(1, 0))
+
+
+def _transfer_apply_right(lt, right, mode, op=None):
+    """Same as :func:`_transfer_apply`, but for ``right`` with axes
+    ``(upper rank, lower rank)`` or ``(rank,)`` on the right of ``lt``
+
+    """
+    ket = lt if op is None else _apply_local(op, lt)
+    if mode == 'pmps':
+        out = np.tensordot(ket, right, axes=(3, 0))
+        return np.tensordot(out, lt.conj(), axes=((1, 2, 3), (1, 2, 3)))
+    return np.tensordot(np.trace(ket, axis1=1, axis2=2), right, axes=(1, 0))
+
+
+def _right_environments(ltens, mode):
+    """Partial traces over the sites right of each bond
+
+    :returns: List ``envs`` with ``envs[i]`` the trace over sites ``i, i
+        + 1, ...`` (``len(envs) == len(ltens) + 1``)
+
+    """
+    envs = [np.ones((1, 1) if mode == 'pmps' else (1,))]
+    for lt in ltens[::-1]:
+        envs.append(_transfer_apply_right(lt, envs[-1], mode))
+    return envs[::-1]
+
+
+def _transfer_site(bond, lt, mode):
+    """Contract ``bond`` with the density matrix tensor of a kept site
+
+    :returns: MPO local tensor with axes ``(x, phys, phys, rank)``
+
+    """
+    if mode == 'mpdo':
+        return np.tensordot(bond, lt, axes=(1, 0))
+    out = np.tensordot(bond, lt, axes=(1, 0))
+    # Axes: 0 x, 1 lower rank, 2 phys, 3 anc, 4 upper rank
+    out = np.tensordot(out, lt.conj(), axes=((1, 3), (0, 2)))
+    # Axes: 0 x, 1 phys, 2 upper rank, 3 phys, 4 lower rank
+    out = out.transpose(0, 1, 3, 2, 4)
+    return out.reshape(out.shape[:3] + (-1,))
+
+
+def _identity_bond(rank, mode):
+    if mode == 'pmps':
+        return np.eye(rank**2).reshape((rank**2, rank, rank))
+    return np.eye(rank)
+
+
+def reduction_mpo(state, support, mode, **kwargs):
+    """Reduced state on an arbitrary set of sites as MPO
+
+    Runs of traced-out sites are contracted into transfer matrices which
+    are absorbed into the neighbouring kept sites. Therefore, the rank of
+    the result is at most :math:`D^2` (PMPS and MPS with rank :math:`D`)
+    or :math:`D` (MPO) and neither a dense density matrix nor a dense
+    reduced state is ever formed.
+
+    Transfer matrices of the sites left and right of the support are
+    computed as environments with cost :math:`O(D^3)` per site, runs
+    between kept sites cost :math:`O(D^5)` per site (PMPS).
+
+    :param state: State as MPS, PMPS or MPO (see ``mode``)
+    :param support: Sites to keep (iterable of distinct site indices)
+    :param mode: ``'mps'``, ``'pmps'`` or ``'mpdo'``
+    :param kwargs: If given, the result is compressed with
+        :func:`mp.MPArray.compress(**kwargs) <mpnum.mparray.MPArray.compress>`
+        (e.g. ``relerr=1e-10``)
+    :returns: MPO with ``len(support)`` sites
+
+    >>> import mpnum as mp
+    >>> mps = mp.random_mps(10, 2, 3, randstate=np.random.RandomState(0))
+    >>> red = mp.reduction_mpo(mps, [1, 7], 'mps')
+    >>> red.shape, red.ranks
+    (((2, 2), (2, 2)), (9,))
+
+    """
+    if mode == 'mps':
+        state, mode = mps_to_pmps(state), 'pmps'
+    elif mode not in ('pmps', 'mpdo'):
+        raise ValueError('Unknown mode {!r}'.format(mode))
+    support = sorted(support)
+    n_sites = len(state)
+    assert len(support) > 0
+    assert len(set(support)) == len(support), "Duplicate sites in support"
+    assert all(0 <= s < n_sites for s in support)
+    ltens = list(state.lt)
+
+    right = np.ones((1, 1) if mode == 'pmps' else (1,))
+    for lt in ltens[:support[-1]:-1]:
+        right = _transfer_apply_right(lt, right, mode)
+
+    bond = np.ones((1, 1, 1) if mode == 'pmps' else (1, 1))
+    result = []
+    kept = set(support)
+    for pos, lt in enumerate(ltens[:support[-1] + 1]):
+        if pos not in kept:
+            bond = _transfer_apply(bond, lt, mode)
+            continue
+        result.append(_transfer_site(bond, lt, mode))
+        bond = _identity_bond(lt.shape[-1], mode)
+    result[-1] = np.tensordot(result[-1], right.reshape((-1, 1)),
+                              axes=(-1, 0))
+
+    red = mp.MPArray(result)
+    if kwargs:
+        red.compress(**kwargs)
+    return red
+
+
+def correlation_matrix(state, op_a, op_b, mode):
+    r"""Two-point correlations :math:`\langle A_i B_j \rangle` for all
+    pairs of sites
+
+    The left environment of site ``i`` is propagated once through the
+    chain. The transfer operator with :math:`A` inserted at site ``i``
+    is propagated to all ``j > i`` and contracted with precomputed right
+    environments, which requires :math:`O(N^2 D^3)` operations in total
+    (instead of one contraction of the full chain per pair).
+
+    :param state: State as MPS, PMPS or MPO (see ``mode``)
+    :param op_a: Local operator :math:`A` (square array)
+    :param op_b: Local operator :math:`B` (square array)
+    :param mode: ``'mps'``, ``'pmps'`` or ``'mpdo'`` (see
+        :func:`reductions`)
+    :returns: Array ``corr`` of shape ``(len(state), len(state))`` with
+        :math:`\operatorname{tr}(\rho A_i B_j)` at ``corr[i, j]`` for ``i
+        <= j`` (for ``i == j``, the local operator is :math:`AB`). The
+        entries with ``i > j`` are zero; use ``correlation_matrix(state,
+        op_b, op_a, mode).T`` to obtain them. The state is not normalized.
+
+    >>> import mpnum as mp
+    >>> mps = mp.random_mps(5, 2, 2, randstate=np.random.RandomState(0))
+    >>> mps /= mp.norm(mps)
+    >>> Z = np.diag([1., -1.])
+    >>> corr = mp.correlation_matrix(mps, Z, Z, 'mps')
+    >>> corr.shape, np.allclose(np.diag(corr), 1)
+    ((5, 5), True)
+
+    """
+    if mode == 'mps':
+        state, mode = mps_to_pmps(state), 'pmps'
+    elif mode not in ('pmps', 'mpdo'):
+        raise ValueError('Unknown mode {!r}'.format(mode))
+    ltens = list(state.lt)
+    n_sites = len(ltens)
+    rights = _right_environments(ltens, mode)
+    op_ab = np.dot(op_a, op_b)
+    dtype = np.result_type(op_a, op_b, *ltens)
+    corr = np.zeros((n_sites, n_sites), dtype=dtype)
+
+    def close(bond, right):
+        return np.tensordot(bond, right, axes=right.ndim)[0]
+
+    left = np.ones((1, 1, 1) if mode == 'pmps' else (1, 1))
+    for i, lt in enumerate(ltens):
+        corr[i, i] = close(_transfer_apply(left, lt, mode, op_ab),
+                           rights[i + 1])
+        bond = _transfer_apply(left, lt, mode, op_a)
+        for j in range(i + 1, n_sites):
+            corr[i, j] = close(_transfer_apply(bond, ltens[j], mode, op_b),
+                               rights[j + 1])
+            if j < n_sites - 1:
+                bond = _transfer_apply(bond, ltens[j], mode)
+        left = _transfer_apply(left, lt, mode)
+    return corr
+
+
+def _window_dm(left, ltens, right, mode):
+    """Reduced density matrix of the sites ``ltens`` given environments
+
+    :returns: Square array with the global row (column) index of the
+        window
+
+    """
+    out = left
+    # Axes: 0 phys, 1 upper rank, 2 lower rank (PMPS) or 0 phys, 1 rank
+    for lt in ltens:
+        if mode == 'pmps':
+            out = np.tensordot(out, lt, axes=(1, 0))
+            # Axes: 0 phys, 1 lower rank, 2 phys, 3 anc, 4 upper rank
+            out = np.tensordot(out, lt.conj(), axes=((1, 3), (0, 2)))
+            # Axes: 0 phys, 1 phys, 2 upper rank, 3 phys, 4 lower rank
+            out = np.rollaxis(out, 3, 2)
+            out = out.reshape((-1,) + out.shape[3:])
+        else:
+            out = np.tensordot(out, lt, axes=(1, 0))
+            out = out.reshape((-1, out.shape[-1]))
+    out = np.tensordot(out, right, axes=right.ndim)
+    dims = [lt.shape[1] for lt in ltens]
+    out = local_to_global(out.reshape([d for d in dims for _ in (0, 1)]),
+                          sites=len(ltens))
+    return out.reshape((np.prod(dims),) * 2)
+
+
+def local_expectations(state, ops, width=1, mode='mps'):
+    r"""Expectation values of local operators on all windows of ``width``
+    consecutive sites
+
+    Left environments are propagated in a single sweep from left to right
+    and right environments are precomputed. The reduced density matrix of
+    each window is computed once and all operators are evaluated with a
+    single :func:`np.tensordot`.
+
+    :param state: State as MPS, PMPS or MPO (see ``mode``)
+    :param ops: List of operators on ``width`` sites, each a square array
+        with the global row (column) index of the window (or an array in
+        global form which can be reshaped to a square array)
+    :param width: Number of sites of the operators (default: 1)
+    :param mode: ``'mps'``, ``'pmps'`` or ``'mpdo'`` (see
+        :func:`reductions`)
+    :returns: Array ``vals`` of shape ``(len(state) - width + 1,
+        len(ops))`` with :math:`\operatorname{tr}(\rho O_k)` for the
+        operator ``ops[k]`` on the sites ``[i, i + width)`` at ``vals[i,
+        k]``. The state is not normalized.
+
+    >>> import mpnum as mp
+    >>> mps = mp.random_mps(6, 2, 2, randstate=np.random.RandomState(0))
+    >>> mps /= mp.norm(mps)
+    >>> X, Z = np.array([[0., 1.], [1., 0.]]), np.diag([1., -1.])
+    >>> vals = mp.local_expectations(mps, [np.eye(2), X, Z], mode='mps')
+    >>> vals.shape, np.allclose(vals[:, 0], 1)
+    ((6, 3), True)
+
+    """
+    if mode == 'mps':
+        state, mode = mps_to_pmps(state), 'pmps'
+    elif mode not in ('pmps', 'mpdo'):
+        raise ValueError('Unknown mode {!r}'.format(mode))
+    ltens = list(state.lt)
+    n_sites = len(ltens)
+    assert 1 <= width <= n_sites
+    ops = np.array([np.asarray(op) for op in ops])
+    dim = int(round(np.sqrt(ops[0].size)))
+    ops = ops.reshape((len(ops), dim, dim))
+    rights = _right_environments(ltens, mode)
+    dtype = np.result_type(ops, *ltens)
+    vals = np.zeros((n_sites - width + 1, len(ops)), dtype=dtype)
+
+    left = np.ones((1, 1, 1) if mode == 'pmps' else (1, 1))
+    for start in range(n_sites - width + 1):
+        window = ltens[start:start + width]
+        rho = _window_dm(left, window, rights[start + width], mode)
+        assert rho.shape == (dim, dim), \
+            "Operator dimension {} does not match sites {}".format(
+                dim, (start, start + width))
+        vals[start] = np.tensordot(ops, rho, axes=((1, 2), (1, 0)))
+        left = _transfer_apply(left, ltens[start], mode)
+    return vals
+
+
+class _Remainders(object):
+    """Partial traces of the first (or last) `n` sites of an MPO
+
+    ``remainders[n]`` is computed iteratively by ``n`` applications of
+    ``step(rem, m)``, which must return the remainder for ``m + 1`` sites
+    given the remainder ``rem`` for ``m`` sites.
+
+    :param cache: Which remainders to keep (see :func:`reductions_mpo`)
+
+    """
+
+    def __init__(self, step, nr_sites, cache='all'):
+        self._step = step
+        if cache == 'all':
+            self._interval = 1
+        elif cache == 'sqrt':
+            self._interval = max(1, int(np.ceil(np.sqrt(nr_sites))))
+        elif cache == 'stream':
+            self._interval = None
+        else:
+            raise ValueError('Unknown cache policy {!r}'.format(cache))
+        # Remainders kept until the end (every `interval`-th remainder)
+        self._checkpoints = {0: np.array(1, ndmin=2)}
+        # Remainders recently computed (the current block between two
+        # checkpoints or the last remainder)
+        self._recent = {}
+
+    def __getitem__(self, num_sites):
+        for cache in (self._checkpoints, self._recent):
+            if num_sites in cache:
+                return cache[num_sites]
+
+        start = max(m for cache in (self._checkpoints, self._recent)
+                    for m in cache if m <= num_sites)
+        rem = self._checkpoints.get(start, self._recent.get(start))
+        if self._interval is None:
+            block_start = num_sites
+        else:
+            block_start = num_sites - num_sites % self._interval
+            if any(m // self._interval != num_sites // self._interval
+                   for m in self._recent):
+                self._recent = {}
+
+        for m in range(start, num_sites):
+            rem = self._step(rem, m)
+            if self._interval is not None and (m + 1) % self._interval == 0:
+                self._checkpoints[m + 1] = rem
+            elif m + 1 >= block_start:
+                self._recent[m + 1] = rem
+        if self._interval is None:
+            self._recent = {num_sites: rem}
+        return rem
+
+
+def reductions_mpo(mpa, width=None, startsites=None, stopsites=None,
+                   cache='all'):
     """Iterate over MPO partial traces of an MPO
 
     The support of the i-th result is :code:`range(startsites[i],
@@ -237,6 +669,22 @@ def reductions_mpo(mpa, width=None, startsites=None, stopsites=None):
         `None`. Must be specified if one or both of `startsites` and
         `stopsites` are not given.
 
+    :param cache: The partial traces over the sites left and right of
+        the support (the remainders) are computed iteratively. ``cache``
+        specifies which of them are kept in memory:
+
+        * ``'all'``: Keep every remainder which has been computed
+          (memory :math:`O(N)`, fastest)
+        * ``'sqrt'``: Keep every :math:`\\sqrt N`-th remainder and the
+          remainders between the last two of those (memory
+          :math:`O(\\sqrt N)`, at most twice as many matrix products as
+          ``'all'`` if the windows slide along the chain)
+        * ``'stream'``: Keep only the most recent remainder on each side
+          (memory :math:`O(1)`, but all remainders which shrink from one
+          window to the next are recomputed from the end of the chain)
+
+        Here, :math:`N` is :code:`len(mpa)`. (default: ``'all'``)
+
     :returns: Iterator over partial traces as MPO
 
     """
@@ -244,41 +692,25 @@ def reductions_mpo(mpa, width=None, startsites=None, stopsites=None):
         _check_reductions_args(len(mpa), width, startsites, stopsites)
 
     assert_array_equal(mpa.ndims, 2)
-    rem_left = {0: np.array(1, ndmin=2)}
-    rem_right = rem_left.copy()
-
-    def get_remainder(rem_cache, num_sites, end):
-        """Obtain the vectors resulting from tracing over
-        the left or right end of a Matrix Product Operator.
-
-        :param rem_cache: Save remainder terms with smaller num_sites here
-        :param num_sites: Number of sites from left or right that have been
-            traced over.
-        :param end: +1 or -1 for tracing over the left or right end
-        """
-        try:
-            return rem_cache[num_sites]
-        except KeyError:
-            rem = get_remainder(rem_cache, num_sites - 1, end)
-            last_pos = num_sites - 1 if end == 1 else -num_sites
-            add = np.trace(mpa.lt[last_pos], axis1=1, axis2=2)
-            if end == -1:
-                rem, add = add, rem
-
-            rem_cache[num_sites] = matdot(rem, add)
-            return rem_cache[num_sites]
-
     num_sites = len(mpa)
+    # `rem_left[n]` is the trace over the leftmost `n` sites,
+    # `rem_right[n]` the trace over the rightmost `n` sites.
+    rem_left = _Remainders(
+        lambda rem, m: matdot(rem, np.trace(mpa.lt[m], axis1=1, axis2=2)),
+        num_sites, cache)
+    rem_right = _Remainders(
+        lambda rem, m: matdot(np.trace(mpa.lt[num_sites - m - 1], axis1=1,
+                                       axis2=2), rem),
+        num_sites, cache)
+
     for start, stop in zip(startsites, stopsites):
         # FIXME we could avoid taking copies here, but then in-place
         # multiplication would have side effects. We could make the
         # affected arrays read-only to turn unnoticed side effects into
         # errors.
         ltens = [lten for lten in mpa.lt[start:stop]]
-        rem = get_remainder(rem_left, start, 1)
-        ltens[0] = matdot(rem, ltens[0])
-        rem = get_remainder(rem_right, num_sites - stop, -1)
-        ltens[-1] = matdot(ltens[-1], rem)
+        ltens[0] = matdot(rem_left[start], ltens[0])
+        ltens[-1] = matdot(ltens[-1], rem_right[num_sites - stop])
         yield mp.MPArray(ltens)
 
 
@@ -289,13 +721,26 @@ def reductions_pmps(pmps, width=None, startsites=None, stopsites=None):
     :func:`reductions_mpo()`.
 
     :param pmps: Mixed state in locally purified MPS representation
-        (PMPS, see :ref:`mpsmpo-definitions`)
+        (PMPS, see :ref:`mpsmpo-definitions`). It is not modified.
     :returns: Iterator over reduced states as PMPS
 
+    Each reduced state requires the sites left (right) of its support to be
+    in left- (right-) canonical form. The orthogonality center is moved
+    from one window to the next on an internal copy of the PMPS, hence
+    windows which slide from left to right (such as the default windows)
+    require a single QR decomposition each. For the default windows of a
+    PMPS which is not in canonical form, the first window needs
+    :code:`len(pmps) - width` QR decompositions and each of the
+    :code:`len(pmps) - width` slides one more, i.e. :code:`2 * (len(pmps)
+    - width)` in total.
+
     """
     startsites, stopsites = \
         _check_reductions_args(len(pmps), width, startsites, stopsites)
 
+    # Canonicalization replaces local tensors, it never modifies them in
+    # place. Therefore, a shallow copy suffices to leave `pmps` untouched.
+    pmps = mp.MPArray(LocalTensors(pmps.lt, cform=pmps.canonical_form))
     for start, stop in zip(startsites, stopsites):
         pmps.canonicalize(left=start, right=stop)
 
@@ -331,18 +776,23 @@ def reductions_mps_as_pmps(mps, width=None, startsites=None, stopsites=None):
     return reductions_pmps(pmps, width, startsites, stopsites)
 
 
-def reductions_mps_as_mpo(mps, width=None, startsites=None, stopsites=None):
+def reductions_mps_as_mpo(mps, width=None, startsites=None, stopsites=None,
+                          executor=None, n_workers=None):
     """Iterate over MPO mpdoreduced states of an MPS
 
     `width`, `startsites` and `stopsites`: See
     :func:`reductions_mpo()`.
 
     :param mps: Pure state as MPS
+    :param executor: Convert the reduced states from PMPS to MPO in
+        parallel, see :func:`_imap` (default: ``None``)
+    :param n_workers: See :func:`_imap` (default: ``None``)
     :returns: Iterator over reduced states as MPO
 
     """
-    return map(pmps_to_mpo, reductions_mps_as_pmps(mps, width, startsites,
-                                                   stopsites))
+    return _imap(pmps_to_mpo,
+                 reductions_mps_as_pmps(mps, width, startsites, stopsites),
+                 executor=executor, n_workers=n_workers)
 
 
 def reductions(state, mode, **kwargs):
@@ -357,7 +807,7 @@ def reductions(state, mode, **kwargs):
         raise ValueError('Unknown mode {!r}'.format(mode))
 
 
-def pmps_to_mpo(pmps):
+def pmps_to_mpo(pmps, rank=None, relerr=None):
     """Convert a local purification MPS to a mixed state MPO.
 
     A mixed state on n sites is represented in local purification MPS
@@ -365,11 +815,78 @@ def pmps_to_mpo(pmps):
     first physical leg is a 'system' site, while the second physical
     leg is an 'ancilla' site.
 
+    If ``rank`` or ``relerr`` is given, the MPO is compressed while it is
+    built (see :func:`_pmps_to_mpo_compressed`). The uncompressed MPO
+    with rank :math:`D^2` and local tensors of size :math:`D^4 d^2` is
+    never formed. The result is close to, but in general not exactly
+    equal to, the SVD compression of the uncompressed MPO.
+
     :param MPArray pmps: An MPA with two physical legs (system and ancilla)
-    :returns: An MPO (density matrix as MPA with two physical legs)
+    :param rank: Maximal rank of the result (default: ``None``)
+    :param relerr: Discard singular values whose sum is smaller than
+        ``relerr`` times the sum of all singular values at each bond, as
+        in :func:`mp.MPArray.compress()
+        <mpnum.mparray.MPArray.compress>` (default: ``None``)
+    :returns: An MPO (density matrix as MPA with two physical legs),
+        right-canonical if compressed
 
     """
-    return mp.dot(pmps, pmps.adj())
+    if rank is None and relerr is None:
+        return mp.dot(pmps, pmps.adj(), astype=mp.MPArray)
+    return _pmps_to_mpo_compressed(pmps, rank, relerr)
+
+
+def _pmps_to_mpo_compressed(pmps, rank, relerr):
+    r"""Compress while converting a PMPS to an MPO (zip-up from the left)
+
+    The PMPS is brought into right-canonical form (on a shallow copy).
+    Sweeping from left to right, the remainder ``carry`` of the previous
+    SVD is contracted with a local tensor and its conjugate. The SVD of
+    the result (of size :math:`k d^2 \times D^2` for a compressed rank
+    :math:`k`) yields the next left-canonical MPO tensor. Memory is
+    :math:`O(k d^2 D^2)`.
+
+    The right part of the MPO is not orthonormal during the sweep, so the
+    truncations of the zip-up are not optimal. The zip-up therefore keeps
+    twice the rank and a tenth of ``relerr``, and the (left-canonical)
+    result is truncated to ``rank`` and ``relerr`` by an SVD sweep from
+    the right.
+
+    """
+    assert rank is None or rank > 0, "Cannot compress to rank={}".format(rank)
+    assert relerr is None or 0. <= relerr <= 1., \
+        "relerr={} not allowed".format(relerr)
+    pmps = mp.MPArray(LocalTensors(pmps.lt, cform=pmps.canonical_form))
+    pmps.canonicalize(right=1)
+    zip_rank = None if rank is None else 2 * rank
+    zip_relerr = None if relerr is None else relerr / 10
+    carry = np.ones((1, 1, 1))
+    # Axes: 0 compressed rank, 1 upper rank, 2 lower rank
+    ltens = []
+    for lt in pmps.lt:
+        out = np.tensordot(carry, lt, axes=(1, 0))
+        # Axes: 0 compr. rank, 1 lower rank, 2 phys, 3 anc, 4 upper rank
+        out = np.tensordot(out, lt.conj(), axes=((1, 3), (0, 2)))
+        # Axes: 0 compr. rank, 1 phys, 2 upper rank, 3 phys, 4 lower rank
+        out = out.transpose(0, 1, 3, 2, 4)
+        shape = out.shape
+        u, sv, v = np.linalg.svd(out.reshape((np.prod(shape[:3]), -1)),
+                                 full_matrices=False)
+        rank_t = len(sv)
+        if zip_relerr is not None:
+            svsum = np.cumsum(sv) / np.sum(sv)
+            rank_t = min(rank_t, np.searchsorted(svsum, 1 - zip_relerr) + 1)
+        if zip_rank is not None:
+            rank_t = min(rank_t, zip_rank)
+        ltens.append(u[:, :rank_t].reshape(shape[:3] + (rank_t,)))
+        carry = (sv[:rank_t, None] * v[:rank_t]).reshape((rank_t,) + shape[3:])
+    # The last carry has shape (1, 1, 1) and contains the norm
+    ltens[-1] = ltens[-1] * carry[0, 0, 0]
+    cform = (len(ltens) - 1, len(ltens))
+    mpo = mp.MPArray(LocalTensors(ltens, cform=cform))
+    mpo.compress('svd', rank=rank, relerr=relerr, direction='left',
+                 canonicalize=False)
+    return mpo
 
 
 def mps_to_pmps(mps):
@@ -399,10 +916,167 @@ def pmps_to_mps(pmps):
     return pmps.reshape([(d[0],) for d in pmps.shape])
 
 
-def mps_to_mpo(mps):
+def mps_to_mpo(mps, rank=None, relerr=None):
     """Convert a pure MPS to a mixed state MPO.
 
     :param MPArray mps: An MPA with one physical leg
+    :param rank: See :func:`pmps_to_mpo`
+    :param relerr: See :func:`pmps_to_mpo`
     :returns: An MPO (density matrix as MPA with two physical legs)
     """
-    return pmps_to_mpo(mps_to_pmps(mps))
+    return pmps_to_mpo(mps_to_pmps(mps), rank=rank, relerr=relerr)
+
+
+class PMPS(mp.MPArray):
+    """Locally purified matrix product state (PMPS)
+
+    Local tensors have the axes ``(left rank, system, ancilla, right
+    rank)``, see :ref:`mpsmpo-definitions`. The represented density
+    matrix is never formed explicitly: Trace, norm, local channels and
+    reductions work on the local tensors of rank :math:`D` instead of
+    the MPO of rank :math:`D^2`.
+
+    All methods inherited from :class:`~mpnum.mparray.MPArray` act on the
+    purification, e.g. :func:`~mpnum.mparray.MPArray.compress` compresses
+    the purification and :func:`mp.norm() <mpnum.mparray.norm>` returns the
+    norm of the purification (the square root of :func:`trace`). Methods
+    which do not preserve the meaning of the system and ancilla legs
+    (:func:`get`, :attr:`T`, :func:`transpose`, :func:`adj`, :func:`sum`,
+    :func:`split` and addition) return a plain
+    :class:`~mpnum.mparray.MPArray`. Pass ``astype=mp.MPArray`` to
+    :func:`mp.dot() <mpnum.mparray.dot>` for the same effect.
+
+    >>> pmps = PMPS.from_mps(mp.MPArray.from_kron([np.array([1., 0.])] * 3))
+    >>> paulis = [np.eye(2), np.array([[0, 1], [1, 0]]),
+    ...           np.array([[0, -1j], [1j, 0]]), np.diag([1, -1])]
+    >>> depolarize = [p / 2 for p in paulis]
+    >>> mixed = pmps.apply_channel(depolarize, sites=[1])
+    >>> mixed.shape
+    ((2, 1), (2, 4), (2, 1))
+    >>> mixed.compress_ancilla()
+    >>> mixed.shape, round(mixed.trace(), 10), round(mixed.dm_norm()**2, 10)
+    (((2, 1), (2, 2), (2, 1)), 1.0, 0.5)
+
+    """
+
+    @classmethod
+    def from_mps(cls, mps):
+        """Pure state PMPS with ancilla dimension one, see
+        :func:`mps_to_pmps`"""
+        return cls(mps_to_pmps(mps)._lt)
+
+    def to_mpo(self, rank=None, relerr=None):
+        """Density matrix as MPO, see :func:`pmps_to_mpo`"""
+        return pmps_to_mpo(self, rank=rank, relerr=relerr)
+
+    def trace(self):
+        """Trace of the density matrix (squared norm of the purification)"""
+        return float(mp.inner(self, self).real)
+
+    def dm_norm(self):
+        """Frobenius norm of the density matrix
+
+        Computed from four copies of the local tensors with :math:`O(D^5)`
+        operations per site (:math:`D^6` for the MPO representation).
+
+        """
+        env = np.ones((1, 1, 1, 1))
+        # Axes: ket/bra rank of first factor, ket/bra rank of second factor
+        for lt in self.lt:
+            env = np.tensordot(env, lt, axes=(0, 0))
+            env = np.tensordot(env, lt.conj(), axes=((0, 4), (0, 2)))
+            # Axes: 0, 1 second factor, 2 phys, 3 ket rank, 4 phys, 5 bra rank
+            env = np.tensordot(env, lt, axes=((0, 4), (0, 1)))
+            env = np.tensordot(env, lt.conj(), axes=((0, 1, 4), (0, 1, 2)))
+        return np.sqrt(abs(env[0, 0, 0, 0]))
+
+    def _as_mparray(self):
+        return mp.MPArray(LocalTensors(self.lt, cform=self.canonical_form))
+
+    def get(self, indices, astype=mp.MPArray):
+        """See :func:`mp.MPArray.get() <mpnum.mparray.MPArray.get>`"""
+        return self._as_mparray().get(indices, astype)
+
+    @property
+    def T(self):
+        """See :attr:`mp.MPArray.T <mpnum.mparray.MPArray.T>`"""
+        return self._as_mparray().T
+
+    def transpose(self, axes=None):
+        """See :func:`mp.MPArray.transpose()
+        <mpnum.mparray.MPArray.transpose>`"""
+        return self._as_mparray().transpose(axes)
+
+    def adj(self):
+        """See :func:`mp.MPArray.adj() <mpnum.mparray.MPArray.adj>`"""
+        return self._as_mparray().adj()
+
+    def sum(self, axes=None):
+        """See :func:`mp.MPArray.sum() <mpnum.mparray.MPArray.sum>`"""
+        return self._as_mparray().sum(axes)
+
+    def split(self, pos):
+        """See :func:`mp.MPArray.split() <mpnum.mparray.MPArray.split>`"""
+        return self._as_mparray().split(pos)
+
+    def compress_ancilla(self, relerr=0.0, rank=None):
+        """Reduce the ancilla dimensions in place
+
+        The density matrix only depends on the products of each local tensor
+        with its conjugate over the ancilla leg. We compute an SVD of each
+        local tensor with the ancilla leg as column index and replace the
+        tensor with the product of the left singular vectors and the
+        singular values. The ancilla dimension at each site is then at most
+        the product of the two ranks and the system dimension.
+
+        :param relerr: Discard singular values of a local tensor whose sum
+            is smaller than ``relerr`` times the sum of all its singular
+            values (default: ``0.0``, i.e. exact)
+        :param rank: Maximal ancilla dimension (default: ``None``)
+
+        """
+        for site, lt in enumerate(list(self.lt)):
+            matrix = lt.transpose(0, 1, 3, 2).reshape((-1, lt.shape[2]))
+            u, sv, _ = np.linalg.svd(matrix, full_matrices=False)
+            svsum = np.cumsum(sv) / np.sum(sv)
+            rank_t = min(len(sv), np.searchsorted(svsum, 1 - relerr) + 1)
+            if rank is not None:
+                rank_t = min(rank_t, rank)
+            shape = lt.shape[:2] + (lt.shape[3], rank_t)
+            newlt = (u[:, :rank_t] * sv[:rank_t]).reshape(shape)
+            self._lt.update(site, newlt.transpose(0, 1, 3, 2))
+
+    def apply_channel(self, kraus, sites=None):
+        """Apply a local channel given by Kraus operators
+
+        The Kraus index is absorbed into the ancilla leg, i.e. the ancilla
+        dimension of each site is multiplied by the number of Kraus
+        operators. Use :func:`compress_ancilla` to reduce it again.
+
+        :param kraus: Kraus operators as array of shape ``(n_kraus,
+            out_dim, in_dim)`` (or sequence of matrices)
+        :param sites: Sites to apply the channel to (default: all)
+        :returns: New :class:`PMPS`
+
+        """
+        kraus = np.asarray(kraus)
+        sites = range(len(self)) if sites is None else set(sites)
+        ltens = []
+        for site, lt in enumerate(self.lt):
+            if site in sites:
+                lt = np.tensordot(lt, kraus, axes=(1, 2))
+                # Axes: 0 left rank, 1 anc, 2 right rank, 3 Kraus, 4 phys
+                lt = lt.transpose(0, 4, 1, 3, 2)
+                lt = lt.reshape(lt.shape[:2] + (-1, lt.shape[-1]))
+            ltens.append(lt)
+        return type(self)(ltens)
+
+    def reductions(self, width=None, startsites=None, stopsites=None):
+        """Reduced states as :class:`PMPS`, see :func:`reductions_pmps`"""
+        reds = reductions_pmps(self, width, startsites, stopsites)
+        return (type(self)(red._lt) for red in reds)
+
+    def reduction(self, support):
+        """Reduced state on ``support`` as :class:`PMPS`, see
+        :func:`pmps_reduction`"""
+        return type(self)(pmps_reduction(self, support)._lt)
@@ -2,4 +2,5 @@
 
 from .localpovm import (  # noqa: F401
     POVM, pauli_parts, pauli_povm, x_povm, y_povm, z_povm)
-from .mppovm import MPPovm, MPPovmList, pauli_mpp, pauli_mpps  # noqa: F401
+from .mppovm import (  # noqa: F401
+    IndicatorTable, MPPovm, MPPovmList, pauli_mpp, pauli_mpps)
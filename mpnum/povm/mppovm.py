@@ -20,6 +20,9 @@ This module provides the following classes:
   for the global observables `XX...X` and `XXY...Y` (cf. below on
   :ref:`mppovm-lfun-overview`).
 
+* :class:`IndicatorTable`: Indicator functions of POVM outcomes on
+  subsets of sites, which are evaluated in a single vectorized pass.
+
 * The methods :func:`MPPovm.embed`,
   :func:`MPPovm.block`/:func:`MPPovmList.block`,
   :func:`MPPovm.repeat`/:func:`MPPovmList.repeat` as well as
@@ -93,7 +96,9 @@ the estimate. In order to perform the two estimation procedures, for
 each probability, we construct an estimator from a weighted average of
 functions of outcomes of different POVMs, as has been explained
 above. For more simple settings, :func:`MPPovmList.est_lfun` is also
-available.
+available. Functions of the form :math:`\theta_y` restricted to a
+subset of sites are stored in an :class:`IndicatorTable`, which avoids
+evaluating one Python function per outcome.
 
 True values of the functions just mentioned can be obtained from
 :func:`MPPovm.lfun`, :func:`MPPovmList.lfun` and
@@ -136,13 +141,17 @@ Class and function reference
 
 from __future__ import absolute_import, division, print_function
 
+import collections
+import functools as ft
 import itertools as it
 import numpy as np
+import scipy.sparse as sp
 
 import mpnum.factory as factory
 import mpnum.mparray as mp
 import mpnum.mpsmpo as mpsmpo
-from ..utils.pmf import project_pmf
+from ..mpstruct import LocalTensors
+from ..utils.pmf import project_nonneg, project_pmf
 
 
 class MPPovm(mp.MPArray):
@@ -187,11 +196,6 @@ class MPPovm(mp.MPArray):
             "Need 3 physical legs at each site: {!r}".format(self.shape)
         assert all(pdims[1] == pdims[2] for pdims in self.shape), \
             "Hilbert space dimension mismatch: {!r}".format(self.shape)
-        # Used to store single outcomes as np.uint8 with 255 = 0xff
-        # denoting "no value" (see :func:`MPPovm.sample`,
-        # :func:`MPPovm.unpack_samples`).
-        assert all(dim <= 255 for dim in self.outdims), \
-            "Maximal outcome dimension 255 exceeded: {!r}".format(self.outdims)
 
     @property
     def outdims(self):
@@ -246,8 +250,81 @@ class MPPovm(mp.MPArray):
         """
         # See :func:`.localpovm.POVM.probability_map` for explanation
         # of the transpose.
-        return self.transpose((0, 2, 1)).reshape(
-            (pdim[0], -1) for pdim in self.shape)
+        pmap = self._cached('probability_map', lambda: self.transpose(
+            (0, 2, 1)).reshape((pdim[0], -1) for pdim in self.shape))
+        # Shallow copy: In-place changes by the caller must not affect
+        # the cached value.
+        return mp.MPArray(LocalTensors(pmap.lt, cform=pmap.canonical_form))
+
+    def _cached(self, key, compute):
+        """Return `compute()`, memoized until `self` changes
+
+        All changes to an MPA replace local tensors (cf.
+        :func:`mpnum.mpstruct.LocalTensors.update`). Therefore, the
+        cache is discarded if one of the local tensors is not the same
+        object anymore. The cache holds references to the local
+        tensors, which keeps their `id()` unique.
+
+        """
+        ltens = tuple(self._lt._ltens)
+        cache = self.__dict__.get('_cache')
+        if cache is None or len(cache[0]) != len(ltens) \
+           or any(a is not b for a, b in zip(cache[0], ltens)):
+            cache = self.__dict__['_cache'] = (ltens, {})
+        values = cache[1]
+        if key not in values:
+            values[key] = compute()
+        return values[key]
+
+    def _conj(self):
+        """Complex conjugate of `self` (cached, do not modify)"""
+        return self._cached('conj', self.conj)
+
+    def _elem_normsq(self):
+        """Squared Frobenius norms of all POVM elements (cached)
+
+        :returns: Read-only array with shape `self.nsoutdims`
+
+        """
+        def compute():
+            normsq = mp.dot(self._conj(), self,
+                            axes=((1, 2), (1, 2)), astype=mp.MPArray)
+            eye3d = mp.MPArray.from_kron(
+                # Drop inner products between different elements
+                np.fromfunction(lambda i, j, k: (i == j) & (j == k),
+                                [outdim] * 3)
+                for outdim in self.outdims
+            )
+            normsq = mp.dot(eye3d, normsq, axes=((1, 2), (0, 1)))
+            normsq = mp.prune(normsq, True).to_array().real
+            normsq.setflags(write=False)
+            return normsq
+        return self._cached('elem_normsq', compute)
+
+    def compile_for(self, state_shape, ranks):
+        """Precompute contraction plans for states of a given shape
+
+        The probability map (see :attr:`MPPovm.probability_map`) and
+        the way in which :func:`MPPovm.pmf_as_array` splits the chain
+        for MPS and PMPS (see :func:`MPPovm._pmf_as_array_pmps_symm`)
+        are computed once and stored on `self` until `self` is
+        modified. These values are also computed and stored on first
+        use; call this method to do it in advance, e.g. before
+        evaluating `self` on many states with the same ranks.
+
+        :param state_shape: Physical shape of the states
+            (`state.shape`)
+        :param ranks: Ranks of the states (`state.ranks`)
+
+        """
+        assert len(state_shape) == len(self)
+        assert len(ranks) == len(self) - 1
+        assert all(shape[0] == dim
+                   for shape, dim in zip(state_shape, self.hdims)), \
+            "Hilbert space dimension mismatch: {!r}".format(state_shape)
+        self.probability_map
+        if len(self) > 1:
+            self._pmps_symm_plan(ranks)
 
     @classmethod
     def from_local_povm(cls, lelems, width):
@@ -440,20 +517,7 @@ class MPPovm(mp.MPArray):
         p = np.ones((1, 1, 1, 1), dtype=float)
         # Axes: 0 probab, 1 POVM leg , 2 PMPS leg , 3 PMPS-cc leg
         for povm_lt, pmps_lt in zip(self.lt, pmps.lt):
-            p = np.tensordot(p, pmps_lt, axes=(2, 0))
-            # 0 probab, 1 POVM bd, 2 PMPS-cc bd, 3 system, 4 ancilla, 5 PMPS bd
-            p = np.tensordot(p, pmps_lt.conj(), axes=((2, 4), (0, 2)))
-            # 0 probab, 1 POVM bd, 2 system, 3 PMPS bd, 4 system', 5 PMPS-cc bd
-            #
-            # NB: We basically transpose povm_lt by specifying suitable axes.
-            # The transpose is explained in localpovm.POVM.probability_map.
-            p = np.tensordot(p, povm_lt, axes=((1, 2, 4), (0, 3, 2)))
-            # 0 probab, 1 PMPS leg , 2 PMPS-cc leg , 3 probab', 4 POVM leg
-            p = p.transpose((0, 3, 4, 1, 2))
-            # 0 probab, 1 probab', 2 POVM leg , 3 PMPS leg , 4 PMPS-cc leg
-            s = p.shape
-            p = p.reshape((s[0] * s[1], s[2], s[3], s[4]))
-            # 0 probab, 1 POVM leg , 2 PMPS leg , 3 PMPS-cc leg
+            p = _pmf_povm_step(_pmf_state_step(p, pmps_lt), povm_lt)
         if partial:
             return p
         s = self.nsoutdims
@@ -472,45 +536,56 @@ class MPPovm(mp.MPArray):
         might also minimize runtime in some cases.
 
         """
-        # Axes of p_left and p_right (below):
-        # 0 probab, 1 POVM leg , 2 PMPS leg , 3 PMPS-cc leg
-        #
-        # p_size[i, j] will contain the p_left.size (i = 0) or
-        # p_right.size (i = 1) for j + 1 probabilities in p_left and
-        # the rest in p_right.
-        cp = np.cumprod(self.outdims, dtype=int)
-        p_size = np.array([cp[:-1], cp[-1] // cp[:-1]])
-        ranks = np.array(state.ranks, int) ** 2 * np.array(self.ranks, int)
-        p_size *= ranks[None, :]
-        # For a given possible choice of n_left, compute the maximum
-        # value of max(p_left.size, p_right.size) encountered during
-        # the computation. Considering all sizes during the
-        # computation can become necessary in some cases. See the
-        # benchmark tests for possible advantages.
-        p_size_max = [max(it.chain(p_size[0, :i], p_size[1, i:]))
-                      for i in range(p_size.shape[1])]
-        # Choose the n_left with the minimal maximum array size.
-        n_left = np.argmin(p_size_max) + 1
-
-        left = MPPovm(self.lt[:n_left])
+        n_left, left, right, s_right = self._pmps_symm_plan(state.ranks)
         p_left = left._pmf_as_array_pmps_ltr(state, partial=True)
         p_left = p_left.reshape((p_left.shape[0], -1))
 
-        right = MPPovm(self.lt[n_left:]).reverse()
         state_right = mp.MPArray(state.lt[n_left:]).reverse()
         p_right = right._pmf_as_array_pmps_ltr(state_right, partial=True)
-        s_right = tuple(d for d in self.outdims[:n_left - 1:-1] if d > 1)
         assert p_right.shape[0] == np.prod(s_right)
         p_right = p_right.reshape(s_right + (-1,)).transpose()
-
-        # We could verify that we predicted the number of elements correctly:
-        #
-        # assert p_left.size == p_size[0, n_left - 1]
-        # assert p_right.size == p_size[1, n_left - 1]
-
         p = np.tensordot(p_left, p_right, axes=(1, 0))
         return p.reshape(self.nsoutdims)
 
+    def _pmps_symm_plan(self, ranks):
+        """Split point for :func:`self._pmf_as_array_pmps_symm` (cached)
+
+        The split point depends only on the state ranks and on the
+        ranks and outcome dimensions of `self`.
+
+        :param ranks: Ranks of the state
+        :returns: `(n_left, left, right, s_right)`: Number of sites
+            `n_left` contracted from the left, the MP-POVMs `left` and
+            `right` (reversed) on either side of the split and the
+            non-singleton outcome dimensions `s_right` of `right`
+
+        """
+        def compute():
+            # Axes of p_left and p_right (cf. _pmf_as_array_pmps_symm):
+            # 0 probab, 1 POVM leg , 2 PMPS leg , 3 PMPS-cc leg
+            #
+            # p_size[i, j] will contain the p_left.size (i = 0) or
+            # p_right.size (i = 1) for j + 1 probabilities in p_left and
+            # the rest in p_right.
+            cp = np.cumprod(self.outdims, dtype=int)
+            p_size = np.array([cp[:-1], cp[-1] // cp[:-1]])
+            all_ranks = np.array(ranks, int) ** 2 * np.array(self.ranks, int)
+            p_size *= all_ranks[None, :]
+            # For a given possible choice of n_left, compute the maximum
+            # value of max(p_left.size, p_right.size) encountered during
+            # the computation. Considering all sizes during the
+            # computation can become necessary in some cases. See the
+            # benchmark tests for possible advantages.
+            p_size_max = [max(it.chain(p_size[0, :i], p_size[1, i:]))
+                          for i in range(p_size.shape[1])]
+            # Choose the n_left with the minimal maximum array size.
+            n_left = np.argmin(p_size_max) + 1
+            left = MPPovm(self.lt[:n_left])
+            right = MPPovm(self.lt[n_left:]).reverse()
+            s_right = tuple(d for d in self.outdims[:n_left - 1:-1] if d > 1)
+            return n_left, left, right, s_right
+        return self._cached(('pmps-symm', tuple(ranks)), compute)
+
     def pmf_as_array(self, state, mode='auto', eps=1e-10, impl='auto'):
         """Compute the POVM's PMF for `state` as full array
 
@@ -546,20 +621,43 @@ class MPPovm(mp.MPArray):
             raise ValueError('Implementation {!r} unknown'.format(impl))
         return project_pmf(pmf, eps, eps)
 
-    def pmfs_as_array(self, states, mode, asarray=False, eps=1e-10):
-        """.. todo:: Add docstring"""
-        pmfs = (self.pmf_as_array(state, mode, eps) for state in states)
+    def pmfs_as_array(self, states, mode, asarray=False, eps=1e-10,
+                      executor=None, n_workers=None):
+        """Compute the POVM's PMF for several states
+
+        :param states: Iterable of states
+        :param mode: See :func:`MPPovm.pmf`
+        :param asarray: Return an array instead of an iterator
+        :param executor: Compute the PMFs in parallel using this
+            :class:`concurrent.futures.Executor` (default: ``None``)
+        :param n_workers: If ``executor`` is not given, compute the PMFs
+            in a thread pool with ``n_workers`` threads (default: ``None``)
+        :returns: Iterator over PMFs as returned by
+            :func:`MPPovm.pmf_as_array` (in the order of `states`)
+
+        """
+        pmf_as_array = ft.partial(self.pmf_as_array, mode=mode, eps=eps)
+        pmfs = mpsmpo._imap(pmf_as_array, states, executor=executor,
+                            n_workers=n_workers)
         if asarray:
             pmfs = np.array(list(pmfs))
         return pmfs
 
     def block_pmfs_as_array(self, state, mode, asarray=False, eps=1e-10,
-                            **redarg):
-        """.. todo:: Add docstring"""
+                            executor=None, n_workers=None, **redarg):
+        """Compute the POVM's PMF for all reduced states of `state`
+
+        The reduced states are computed by :func:`mpsmpo.reductions` with
+        arguments `redarg` (default: all reductions to ``len(self)``
+        consecutive sites). The remaining parameters: See
+        :func:`MPPovm.pmfs_as_array`.
+
+        """
         if len(redarg) == 0:
             redarg['width'] = len(self)
         states, newmode = mpsmpo.reductions(state, mode, **redarg)
-        return self.pmfs_as_array(states, newmode, asarray, eps)
+        return self.pmfs_as_array(states, newmode, asarray, eps, executor,
+                                  n_workers)
 
     def match_elems(self, other, exclude_dup=(), eps=1e-10):
         """Find POVM elements in `other` which have information on `self`
@@ -604,29 +702,13 @@ class MPPovm(mp.MPArray):
         other = MPPovm(mp.dot(tr, other).lt)
 
         # Compute all inner products between elements from self and other
-        inner = mp.dot(self.conj(), other,
+        inner = mp.dot(self._conj(), other,
                        axes=((1, 2), (1, 2)), astype=mp.MPArray)
-        # Compute squared norms of all elements from inner products
-        snormsq = mp.dot(self.conj(), self,
-                         axes=((1, 2), (1, 2)), astype=mp.MPArray)
-        eye3d = mp.MPArray.from_kron(
-            # Drop inner products between different elements
-            np.fromfunction(lambda i, j, k: (i == j) & (j == k), [outdim] * 3)
-            for outdim in self.outdims
-        )
-        snormsq = mp.dot(eye3d, snormsq, axes=((1, 2), (0, 1)))
-        onormsq = mp.dot(other.conj(), other,
-                         axes=((1, 2), (1, 2)), astype=mp.MPArray)
-        eye3d = mp.MPArray.from_kron(
-            # Drop inner products between different elements
-            np.fromfunction(lambda i, j, k: (i == j) & (j == k), [outdim] * 3)
-            for outdim in other.outdims
-        )
-        onormsq = mp.dot(eye3d, onormsq, axes=((1, 2), (0, 1)))
+        # Compute squared norms of all elements
+        snormsq = self._elem_normsq()
+        onormsq = other._elem_normsq()
         inner = abs(mp.prune(inner, True).to_array_global())**2
         inner = inner.reshape(tuple(d for d in inner.shape if d > 1))
-        snormsq = mp.prune(snormsq, True).to_array().real
-        onormsq = mp.prune(onormsq, True).to_array().real
         assert (snormsq > 0).all()
         assert (onormsq > 0).all()
         assert inner.shape == snormsq.shape + onormsq.shape
@@ -680,8 +762,8 @@ class MPPovm(mp.MPArray):
         p = marginal_pmf[-1].get(tuple(out)).to_array()
         assert abs(p - out_p) <= eps
 
-    def _sample_cond(self, rng, state, mode, n_samples, n_group, out, eps):
-        """Sample using conditional probabilities (call :func:`self.sample`)"""
+    def _sample_cond_setup(self, state, mode, n_group, eps):
+        """Marginal PMFs for conditional sampling (see :func:`self.sample`)"""
         pmf = mp.prune(self.pmf(state, mode), singletons=True)
         pmf_sum = pmf.sum()
         # For large numbers of sites, NaNs appear. Why?
@@ -699,27 +781,222 @@ class MPPovm(mp.MPArray):
                 p = mp.prune(p)
             marginal_pmf[n_sites] = p
         assert abs(marginal_pmf[0] - 1.0) <= eps
+        return marginal_pmf
+
+    @staticmethod
+    def _sample_cond_draw(rng, marginal_pmf, n_samples, n_group, out, valid,
+                          eps):
+        """Sample using conditional probabilities (call :func:`self.sample`)"""
         for i in range(n_samples):
-            self._sample_cond_single(rng, marginal_pmf, n_group, out[i, :], eps)
+            MPPovm._sample_cond_single(rng, marginal_pmf, n_group, out[i, :],
+                                       eps)
+            valid[i, :] = True
+
+    def _sample_cond_batch_setup(self, state, mode, n_group, eps):
+        """Grouped PMF tensors and marginals for batched conditional
+        sampling (see :func:`self._sample_cond_batch_draw`)"""
+        pmf = mp.prune(self.pmf(state, mode), singletons=True)
+        pmf_sum = pmf.sum()
+        assert abs(pmf_sum.imag) <= eps
+        assert abs(1.0 - pmf_sum.real) <= eps
+        ltens = list(pmf.lt)
+        # Merge groups of `n_group` sites into one site each
+        groups = []
+        for start in range(0, len(ltens), n_group):
+            lt = ltens[start]
+            for lt_next in ltens[start + 1:start + n_group]:
+                lt = np.tensordot(lt, lt_next, axes=(-1, 0))
+            groups.append((lt.shape[1:-1], start,
+                           lt.reshape((lt.shape[0], -1, lt.shape[-1]))))
+        # right[k] is the marginal of the sites from group k onwards
+        right = [np.ones(1)]
+        for _, _, lt in groups[::-1]:
+            right.append(np.dot(lt.sum(1), right[-1]))
+        right = right[::-1]
+        return [(dims, start, lt, np.dot(lt, rem))
+                for (dims, start, lt), rem in zip(groups, right[1:])]
+
+    @staticmethod
+    def _sample_cond_batch_draw(rng, groups, n_samples, n_group, out, valid,
+                                eps):
+        """Conditional sampling of all samples at once (call
+        :func:`self.sample`)
+
+        All samples advance by `n_group` sites at a time. For each sample,
+        we keep the contraction of the PMF local tensors left of the
+        current sites with the outcomes sampled so far (`left`, a matrix
+        of shape `(n_samples, rank)`). The conditional probabilities of
+        all samples are obtained from one matrix product with the
+        current local tensor summed with the marginal of the remaining
+        sites (`lt_rem`, computed once per state). Outcomes are drawn by
+        inverse transform sampling, and `left` is updated with the local
+        tensor at the drawn outcome of each sample (one `einsum`). Samples are processed in batches such
+        that memory does not grow with `n_samples` times the number of
+        outcomes on `n_group` sites.
 
-    def _sample_direct(self, rng, state, mode, n_samples, out, eps):
-        """Sample from full pmfilities (call :func:`self.sample`)"""
+        """
+        size = max(max(lt_rem.size, lt.shape[0] * lt.shape[-1])
+                   for _, _, lt, lt_rem in groups)
+        batch = max(1, 2**22 // size)
+        for start in range(0, n_samples, batch):
+            n_batch = min(batch, n_samples - start)
+            rows = np.arange(n_batch)
+            left = np.ones((n_batch, 1))
+            for dims, col, lt, lt_rem in groups:
+                # The PMF is real, its local tensors need not be
+                p = np.dot(left, lt_rem).real
+                # `left` is normalized by the probability of the partial
+                # output
+                p = project_nonneg(p, eps, eps)
+                assert (abs(p.sum(1) - 1.0) <= eps).all()
+                cdf = np.cumsum(p, axis=1)
+                u = rng.random_sample(n_batch) * cdf[:, -1]
+                choice = np.minimum((cdf <= u[:, None]).sum(1),
+                                    p.shape[1] - 1)
+                out[start:start + n_batch, col:col + len(dims)] = \
+                    np.array(np.unravel_index(choice, dims)).T
+                valid[start:start + n_batch, col:col + len(dims)] = True
+                left = np.einsum('sl,lsr->sr', left, lt[:, choice, :]) \
+                    / p[rows, choice][:, None]
+
+    def _sample_canonical_setup(self, state, mode, n_group, eps):
+        """Local tensors and right environments for sampling from the
+        canonical form (see :func:`self._sample_canonical_draw`)"""
+        if mode == 'auto' and all(ndims == 1 for ndims in state.ndims):
+            mode = 'mps'
+        if mode == 'mps':
+            state = mpsmpo.mps_to_pmps(state)
+        elif mode != 'pmps':
+            raise ValueError("method='canonical' requires mode 'mps' or "
+                             "'pmps', not {!r}".format(mode))
+        pmps = mp.MPArray(LocalTensors(state.lt, cform=state.canonical_form))
+        pmps.canonicalize(right=1)
+
+        right = [np.ones((1, 1, 1))]
+        # Axes: 0 POVM leg, 1 PMPS leg, 2 PMPS-cc leg
+        for povm_lt, pmps_lt in zip(self.lt[::-1], pmps.lt[::-1]):
+            r = np.tensordot(pmps_lt, right[-1], axes=(3, 1))
+            # 0 PMPS bd, 1 system, 2 ancilla, 3 POVM bd, 4 PMPS-cc bd
+            r = np.tensordot(r, pmps_lt.conj(), axes=((2, 4), (2, 3)))
+            # 0 PMPS bd, 1 system, 2 POVM bd, 3 PMPS-cc bd, 4 system'
+            r = np.tensordot(povm_lt.sum(1), r, axes=((3, 2, 1), (2, 1, 4)))
+            right.append(r)
+        return list(zip(self.lt, pmps.lt, right[-2::-1]))
+
+    @staticmethod
+    def _sample_canonical_draw(rng, sites, n_samples, n_group, out, valid,
+                               eps):
+        """Sample from MPS/PMPS without the PMF MPA (call :func:`self.sample`)
+
+        The tensor network from :func:`self._pmf_as_array_pmps_ltr` is
+        contracted from left to right for a batch of samples, with the
+        outcomes sampled so far fixed (`p`). Contracting `p` with the
+        local tensors and the sum over all outcomes of the remaining sites
+        (`rem`, computed once per state) provides the conditional
+        probabilities of the next outcome. The state is right-canonicalized
+        (on a shallow copy) beforehand, such that the environments are
+        well-conditioned; for a product of local POVMs, they are identity
+        matrices.
+
+        """
+        # Process samples in batches of bounded memory
+        size = max(lt.shape[1] * r.size for lt, _, r in sites)
+        batch = max(1, 2**22 // size)
+        for start in range(0, n_samples, batch):
+            n_batch = min(batch, n_samples - start)
+            rows = np.arange(n_batch)
+            p = np.ones((n_batch, 1, 1, 1))
+            # Axes: 0 sample, 1 POVM leg, 2 PMPS leg, 3 PMPS-cc leg
+            col = 0
+            for povm_lt, pmps_lt, rem in sites:
+                p = _pmf_povm_step(_pmf_state_step(p, pmps_lt), povm_lt)
+                p = p.reshape((n_batch, -1) + p.shape[1:])
+                # 0 sample, 1 outcome, 2 POVM leg, 3 PMPS leg, 4 PMPS-cc leg
+                cond = np.tensordot(p, rem, axes=((2, 3, 4), (0, 1, 2)))
+                # `p` is normalized by the probability of the partial output
+                cond = project_nonneg(cond, eps, eps)
+                assert (abs(cond.sum(1) - 1.0) <= eps).all()
+                cdf = np.cumsum(cond, axis=1)
+                u = rng.random_sample(n_batch) * cdf[:, -1]
+                choice = np.minimum((cdf <= u[:, None]).sum(1),
+                                    cond.shape[1] - 1)
+                p = p[rows, choice] / cond[rows, choice][:, None, None, None]
+                if cond.shape[1] > 1:
+                    out[start:start + n_batch, col] = choice
+                    valid[start:start + n_batch, col] = True
+                    col += 1
+
+    def _sample_direct_setup(self, state, mode, n_group, eps):
+        """Cumulative distribution of all outcomes for direct sampling"""
         pmf = self.pmf_as_array(state, mode, eps)
-        choices = rng.choice(pmf.size, n_samples, p=pmf.flat)
-        for pos, c in enumerate(np.unravel_index(choices, pmf.shape)):
+        cdf = np.cumsum(pmf.flat)
+        cdf /= cdf[-1]
+        return cdf, pmf.shape
+
+    @staticmethod
+    def _sample_direct_draw(rng, cdf_shape, n_samples, n_group, out, valid,
+                            eps):
+        """Sample from full probabilities (call :func:`self.sample`)"""
+        cdf, shape = cdf_shape
+        # Same as `rng.choice(cdf.size, n_samples, p=pmf.flat)`
+        choices = cdf.searchsorted(rng.random_sample(n_samples), side='right')
+        for pos, c in enumerate(np.unravel_index(choices, shape)):
             out[:, pos] = c
+            valid[:, pos] = True
+
+    _SAMPLE_METHODS = {
+        'cond': ('_sample_cond_setup', '_sample_cond_draw'),
+        'cond-batch': ('_sample_cond_batch_setup', '_sample_cond_batch_draw'),
+        'canonical': ('_sample_canonical_setup', '_sample_canonical_draw'),
+        'direct': ('_sample_direct_setup', '_sample_direct_draw'),
+    }
+
+    def _sample_setup(self, state, mode, method, n_group, eps):
+        """Set up a sampling method for `state` (call :func:`self.sample`)
+
+        :returns: Sampler for :func:`MPPovm._sample_draw`, which contains
+            the result of the per-state setup (e.g. the PMF MPA and its
+            marginals) but neither `self` nor `state`
+
+        """
+        try:
+            setup, _ = self._SAMPLE_METHODS[method]
+        except KeyError:
+            raise ValueError('Unknown method {!r}'.format(method))
+        data = getattr(self, setup)(state, mode, n_group, eps)
+        return method, n_group, eps, data
+
+    @staticmethod
+    def _sample_draw(rng, sampler, n_samples, out, valid):
+        """Draw samples with a sampler from :func:`MPPovm._sample_setup`
+
+        The sampling methods write outcomes into `out` and set the
+        corresponding entries of the boolean mask `valid` to `True`.
+
+        """
+        method, n_group, eps, data = sampler
+        _, draw = MPPovm._SAMPLE_METHODS[method]
+        getattr(MPPovm, draw)(rng, data, n_samples, n_group, out, valid, eps)
 
     def sample(self, rng, state, n_samples, method='cond', n_group=1,
-               mode='auto', pack=False, eps=1e-10):
+               mode='auto', pack=False, eps=1e-10, n_workers=None,
+               block_size=2**16):
         """Random sample from `self` on a quantum state
 
         :param mp.MPArray state: A quantum state as MPA (see `mode`)
         :param n_samples: Number of samples to create
-        :param method: Sampling method (`'cond'` or `'direct'`, see below)
+        :param method: Sampling method (`'cond'`, `'cond-batch'`,
+            `'canonical'` or `'direct'`, see below)
         :param n_group: Number of sites to sample at a time in
             conditional sampling.
         :param mode: Passed to :func:`MPPovm.expectations`
         :param eps: Threshold for small values to be treated as zero.
+        :param n_workers: If not `None`, split the samples into blocks of
+            `block_size` samples with independent random number streams
+            and sample the blocks in a pool of `n_workers` processes
+            (see below). (default: `None`)
+        :param block_size: Number of samples per block if `n_workers` is
+            not `None` (default: `2**16`)
 
         Two different sampling methods are available:
 
@@ -736,30 +1013,164 @@ class MPPovm(mp.MPArray):
           measurements which act on large parts of a system
           (e.g. Pauli X on each spin).
 
+        * Batched conditional sampling (`method='cond-batch'`): Same as
+          `'cond'`, but all samples are drawn at the same time with a few
+          matrix products per group of `n_group` sites. Much faster than
+          `'cond'` for many samples, requires memory linear in the number
+          of outcomes on `n_group` sites times the rank of the PMF MPA.
+
+        * Sampling from the canonical form (`method='canonical'`, only for
+          mode `'mps'` or `'pmps'`): Conditional probabilities are
+          computed from the local tensors of the state and the POVM. The
+          PMF MPA (whose rank is the squared rank of the state times the
+          rank of the POVM) is never formed, which makes this method
+          applicable to states of larger rank than `'cond-batch'`.
+          `n_group` is ignored.
+
         :returns: ndarray `samples` with shape `(n_samples,
-            len(self.nsoutdims))`
+            len(self.nsoutdims))` and dtype :func:`MPPovm.sample_dtype`
 
         The `i`-th sample is given by `samples[i, :]`. `samples[i, j]`
         is the outcome for the `j`-th non-singleton output dimension
         of `self`.
 
+        If `n_workers` is given, one seed per block is derived from `rng`
+        (with :class:`numpy.random.SeedSequence` if available). Hence,
+        the samples depend on `rng` and `block_size`, but not on
+        `n_workers`. The sampling method is set up (e.g. the PMF MPA is
+        computed) once in the calling process. Each worker process
+        receives the result once (but neither `self` nor `state`) and
+        writes its samples into an output array in shared memory, which
+        is returned without a copy.
+
+        """
+        assert len(self) == len(state)
+        sampler = self._sample_setup(state, mode, method, n_group, eps)
+        samples, = self._sample_chunks(rng, sampler, [n_samples], pack,
+                                       n_workers, block_size)
+        return samples
+
+    def _sample_chunks(self, rng, sampler, sizes, pack, n_workers,
+                       block_size):
+        """Draw chunks of `sizes` samples with the same sampler (call
+        :func:`self.sample`)"""
+        nsoutdims = np.array(self.nsoutdims)
+        chunks = _sample_chunks(sampler, rng, sizes, len(nsoutdims),
+                                self.sample_dtype(), block_size, n_workers)
+        for out in chunks:
+            assert (out < nsoutdims[None, :]).all()
+            if pack:
+                yield self.pack_samples(out, dtype=pack)
+            else:
+                yield out
+
+    def sample_iter(self, rng, state, n_samples, chunk_size=2**16,
+                    method='cond', n_group=1, mode='auto', pack=False,
+                    eps=1e-10, n_workers=None, block_size=2**16):
+        """Random samples from `self` on a quantum state in chunks
+
+        :param chunk_size: Maximal number of samples per chunk
+            (default: `2**16`)
+        :returns: Iterator over return values of :func:`MPPovm.sample`
+            with a total of `n_samples` samples
+
+        Other parameters: See :func:`MPPovm.sample`.
+
+        Use this function if all samples do not fit into memory at the
+        same time (see also :func:`MPPovm.sample_to_file`). The sampling
+        method is set up once for all chunks. If `n_workers` is given,
+        all chunks are sampled in the same process pool. The samples are
+        the same as from calling :func:`MPPovm.sample` for each chunk.
+
         """
         assert len(self) == len(state)
-        # The value 255 means "data missing". The values 0..254 are
-        # available for measurement outcomes.
-        assert all(dim <= 255 for dim in self.outdims)
-        out = np.zeros((n_samples, len(self.nsoutdims)), dtype=np.uint8)
-        out[...] = 0xff
-        if method == 'cond':
-            self._sample_cond(rng, state, mode, n_samples, n_group, out, eps)
-        elif method == 'direct':
-            self._sample_direct(rng, state, mode, n_samples, out, eps)
+        sampler = self._sample_setup(state, mode, method, n_group, eps)
+        sizes = [min(chunk_size, n_samples - start)
+                 for start in range(0, n_samples, chunk_size)]
+        for samples in self._sample_chunks(rng, sampler, sizes, pack,
+                                           n_workers, block_size):
+            yield samples
+
+    def sample_dtype(self):
+        """Smallest unsigned integer type for (unpacked) samples
+
+        :returns: `np.uint8`, `np.uint16`, `np.uint32` or `np.uint64`,
+            depending on the largest outcome dimension
+
+        """
+        max_out = max(self.nsoutdims + (1,)) - 1
+        for dtype in (np.uint8, np.uint16, np.uint32):
+            if max_out <= np.iinfo(dtype).max:
+                return dtype
+        return np.uint64
+
+    def _pack_groups(self):
+        """Split non-singleton outcomes into groups for packing (cached)
+
+        :returns: List of `(start, stop)` such that the outcomes on
+            positions `start, ..., stop - 1` in `self.nsoutdims` fit into
+            one 64-bit integer
+
+        """
+        def compute():
+            groups, start, size = [], 0, 1
+            for pos, dim in enumerate(self.nsoutdims):
+                if size * dim - 1 > np.iinfo(np.int64).max:
+                    groups.append((start, pos))
+                    start, size = pos, 1
+                size *= dim
+            groups.append((start, len(self.nsoutdims)))
+            return groups
+        return self._cached('pack_groups', compute)
+
+    def packed_dtype(self):
+        """Smallest integer type for :func:`MPPovm.pack_samples`
+
+        :returns: Numpy integer type or `None` if packed samples do not
+            fit into a 64-bit integer (:func:`MPPovm.pack_samples`
+            returns several 64-bit integers per sample in this case)
+
+        """
+        n_out = ft.reduce(lambda x, y: x * y, self.nsoutdims, 1)
+        for dtype in (np.uint8, np.uint16, np.uint32, np.int64):
+            if n_out - 1 <= np.iinfo(dtype).max:
+                return dtype
+        return None
+
+    def sample_to_file(self, path, rng, state, n_samples, chunk_size=2**16,
+                       **kwargs):
+        """Write random samples to a `.npy` file chunk by chunk
+
+        Samples are created by :func:`MPPovm.sample_iter`, packed with
+        :func:`MPPovm.pack_samples` into the type given by
+        :func:`MPPovm.packed_dtype` and written to a memory-mapped `.npy`
+        file. If packed samples do not fit into a 64-bit integer, the
+        unpacked samples are written. Memory use is proportional to
+        `chunk_size`.
+
+        :param path: Name of the output file
+        :param kwargs: Passed to :func:`MPPovm.sample` (except `pack`)
+        :returns: The samples as read-only memory map
+
+        """
+        assert 'pack' not in kwargs
+        dtype = self.packed_dtype()
+        if dtype is None:
+            shape, dtype = (n_samples, len(self.nsoutdims)), self.sample_dtype()
         else:
-            raise ValueError('Unknown method {!r}'.format(method))
-        assert (out < np.array(self.nsoutdims)[None, :]).all()
-        if pack:
-            return self.pack_samples(out, dtype=pack)
-        return out
+            shape = (n_samples,)
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                        shape=shape)
+        start = 0
+        for chunk in self.sample_iter(rng, state, n_samples, chunk_size,
+                                      **kwargs):
+            if len(shape) == 1:
+                chunk = self.pack_samples(chunk, dtype=dtype)
+            out[start:start + len(chunk)] = chunk
+            start += len(chunk)
+        out.flush()
+        del out
+        return np.load(path, mmap_mode='r')
 
     def pack_samples(self, samples, dtype=None):
         """Pack samples into one integer per sample
@@ -773,10 +1184,27 @@ class MPPovm(mp.MPArray):
         >>> p.pack_samples(np.array([[0, 1], [1, 0], [1, 2], [5, 5]]))
         array([ 1,  6,  8, 35])
 
+        If the number of possible outcomes exceeds :math:`2^{63}`, a
+        sample is packed into several integers (multi-word keys): The
+        return value has shape `(n_samples, n_words)`, where each column
+        holds the packed outcomes of consecutive sites. ``dtype`` applies
+        to each word.
+
+        >>> p = pauli_mpp(nr_sites=30, local_dim=2)
+        >>> p.pack_samples(np.ones((5, 30), dtype=int)).shape
+        (5, 2)
+
         """
         assert samples.ndim == 2
         assert samples.shape[1] == len(self.nsoutdims)
-        samples = np.ravel_multi_index(samples.T, self.nsoutdims)
+        groups = self._pack_groups()
+        if len(groups) > 1:
+            samples = np.array([
+                np.ravel_multi_index(samples[:, start:stop].T,
+                                     self.nsoutdims[start:stop])
+                for start, stop in groups]).T
+        else:
+            samples = np.ravel_multi_index(samples.T, self.nsoutdims)
         if dtype not in (True, False, None) and issubclass(dtype, np.integer):
             info = np.iinfo(dtype)
             assert samples.min() >= info.min
@@ -798,19 +1226,85 @@ class MPPovm(mp.MPArray):
                [1, 1],
                [2, 0]], dtype=uint8)
 
+        The returned samples have dtype :func:`MPPovm.sample_dtype`.
+
+        """
+        groups = self._pack_groups()
+        if samples.ndim == 1:
+            samples = samples[:, None]
+        assert samples.ndim == 2
+        assert samples.shape[1] == len(groups)
+        return np.concatenate([
+            np.array(np.unravel_index(samples[:, pos],
+                                      self.nsoutdims[start:stop]),
+                     dtype=self.sample_dtype()).T
+            for pos, (start, stop) in enumerate(groups)], axis=1)
+
+    def count_samples(self, samples):
+        """Count distinct outcomes in samples
+
+        The outcome counts are returned in a sparse format: Only
+        outcomes which occur in `samples` are included. Unlike
+        :func:`MPPovm.est_pmf`, this does not allocate memory for the
+        entire outcome space. Example:
+
+        >>> p = pauli_mpp(nr_sites=2, local_dim=2)
+        >>> out, counts = p.count_samples(np.array([[5, 5], [0, 1], [5, 5]]))
+        >>> out
+        array([[0, 1],
+               [5, 5]], dtype=uint8)
+        >>> counts
+        array([1, 2])
+
+        :param np.ndarray samples: `(n_samples, len(self.nsoutdims))`
+            array of samples or packed samples from
+            :func:`MPPovm.pack_samples` (including multi-word keys)
+
+        :returns: `(outcomes, counts)`: `outcomes` is a shape
+            `(n_distinct, len(self.nsoutdims))` array of distinct
+            outcomes (in lexicographic order) and `counts` is a
+            length `n_distinct` array of integer counts. This pair
+            can be passed instead of samples to
+            :func:`MPPovm.est_pmf`, :func:`MPPovm.est_lfun` and
+            :func:`MPPovm.est_pmf_from`.
+
         """
-        assert samples.ndim == 1
-        assert all(dim <= 255 for dim in self.outdims)
-        return np.array(np.unravel_index(samples, self.nsoutdims)) \
-                 .T.astype(np.uint8)
+        if samples.ndim == 2 and samples.shape[1] == len(self.nsoutdims):
+            samples = self.pack_samples(samples)
+        if samples.ndim == 1:
+            outcomes, counts = np.unique(samples, return_counts=True)
+        else:
+            # Multi-word keys, see :func:`MPPovm.pack_samples`
+            outcomes, counts = np.unique(samples, axis=0, return_counts=True)
+        return self.unpack_samples(outcomes), counts
 
-    def est_pmf(self, samples, normalize=True, eps=1e-10):
+    def _as_counts(self, samples):
+        """Return `(samples, counts, n_samples)` for samples or sparse counts
+
+        `counts` is `None` if `samples` is not a pair from
+        :func:`MPPovm.count_samples`.
+
+        """
+        if isinstance(samples, tuple):
+            samples, counts = samples
+            assert samples.ndim == 2
+            assert counts.shape == samples.shape[:1]
+            return samples, counts, counts.sum()
+        return samples, None, samples.shape[0]
+
+    def est_pmf(self, samples, normalize=True, eps=1e-10, sparse=False):
         """Estimate probability mass function from samples
 
         :param np.ndarray samples: `(n_samples, len(self.nsoutdims))`
-            array of samples
+            array of samples or a pair `(outcomes, counts)` from
+            :func:`MPPovm.count_samples`
         :param bool normalize: True: Return normalized probability
             estimates (default). False: Return integer outcome counts.
+        :param bool sparse: True: Return `(outcomes, est_pmf)` for the
+            outcomes which occur in `samples` only (see
+            :func:`MPPovm.count_samples`). Use this if the outcome
+            space is too large to hold in memory. False: Return
+            probabilities for all outcomes (default).
         :returns: Estimated probabilities as ndarray `est_pmf` with
             shape `self.nsoutdims`
 
@@ -818,11 +1312,20 @@ class MPPovm(mp.MPArray):
         occurences of outcome `(i1, ..., ik)` in `samples`.
 
         """
-        n_samples = samples.shape[0]
+        if sparse:
+            if not isinstance(samples, tuple):
+                samples = self.count_samples(samples)
+            outcomes, counts = samples
+            if normalize:
+                return outcomes, counts / counts.sum()
+            return outcomes, counts
+        samples, weights, n_samples = self._as_counts(samples)
         n_out = np.prod(self.nsoutdims)
         if samples.ndim > 1:
             samples = self.pack_samples(samples)
-        counts = np.bincount(samples, minlength=n_out)
+        counts = np.bincount(samples, weights, minlength=n_out)
+        if weights is not None:
+            counts = counts.astype(weights.dtype)
         assert counts.shape == (n_out,)
         counts = counts.reshape(self.nsoutdims)
         assert counts.sum() == n_samples
@@ -839,8 +1342,9 @@ class MPPovm(mp.MPArray):
             the estimated values of the individual functions and the
             estimated covariance matrix of the estimates.
         :param np.ndarray funs: A length `n_funs` sequence of
-            functions. If `None`, the estimated function will be a
-            linear function of the POVM probabilities.
+            functions or an :class:`IndicatorTable`. If `None`, the
+            estimated function will be a linear function of the POVM
+            probabilities.
 
         For further information, see also :ref:`mppovm-lfun-overview`.
 
@@ -857,28 +1361,19 @@ class MPPovm(mp.MPArray):
 
         pmf = self.pmf_as_array(state, mode, eps=eps)
         n_out = np.prod(self.nsoutdims)
-        if funs is not None:
+        if funs is None:
+            fun_out = sp.identity(n_out, dtype=float, format='csr')
+        else:
             out = np.array(np.unravel_index(range(n_out), self.nsoutdims)) \
                     .T.copy()
-            fun_out = np.zeros((len(funs), n_out), float)
-            fun_out[:] = np.nan
-            for pos, fun in enumerate(funs):
-                fun_out[pos, :] = fun(out)
-        else:
-            fun_out = np.eye(n_out, dtype=float)
+            fun_out = _eval_funs(funs, out)
         if coeff is not None:
             assert coeff.shape == (fun_out.shape[0],)
-        w_fun_out = fun_out * pmf.ravel()[None, :]
-        ept = w_fun_out.sum(1)
-        # Covariance matrix of the functions
-        cov = np.dot(fun_out, w_fun_out.T) - np.outer(ept, ept)
         if coeff is None:
-            return ept, cov
+            return _lfun_moments(fun_out, pmf.ravel(), 1.0, None)
 
-        # Expectation value
-        est = np.inner(coeff, ept)
-        # Variance
-        var_est = np.inner(coeff, np.dot(cov, coeff))
+        # Expectation value and variance
+        est, var_est = _lfun_moments(fun_out, pmf.ravel(), 1.0, coeff)
         assert var_est >= -eps
         if var_est < 0:
             var_est = 0
@@ -889,10 +1384,13 @@ class MPPovm(mp.MPArray):
 
         This function estimates the function with exact value given by
         :func:`MPPovm.lfun`; see there for description of the
-        parameters `coeff` and `funs`.
+        parameters `coeff` and `funs`. If `funs` is `None` or an
+        :class:`IndicatorTable`, the functions are evaluated once per
+        distinct outcome (see :func:`MPPovm.count_samples`).
 
         :param np.ndarray samples: A shape `(n_samples,
-            len(self.nsoutdims))` with samples from `self`
+            len(self.nsoutdims))` with samples from `self` or a pair
+            `(outcomes, counts)` from :func:`MPPovm.count_samples`
         :param weights: A length `n_samples` array for weighted
             samples. You can submit counts by passing them as
             weights. The number of samples used in average and
@@ -905,17 +1403,17 @@ class MPPovm(mp.MPArray):
 
         """
         if funs is None:
-            # In this special case, we could make the implementation faster.
-            n_out = np.prod(self.nsoutdims)
-            out = np.array(np.unravel_index(range(n_out), self.nsoutdims)) \
-                    .T[:, None, :].copy()
-            funs = [lambda s, pos=pos: (s == out[pos]).all(1)
-                    for pos in range(n_out)]
+            funs = IndicatorTable.all_outcomes(self.nsoutdims)
         n_funs = len(funs)
         if coeff is not None:
             assert coeff.ndim == 1
             assert coeff.dtype.kind == 'f'
             assert coeff.shape[0] == n_funs
+        samples, counts, _ = self._as_counts(samples)
+        if counts is not None:
+            weights = counts if weights is None else weights * counts
+        elif weights is None and isinstance(funs, IndicatorTable):
+            samples, weights = self.count_samples(samples)
         assert samples.ndim == 2
         n_samples = n_avg_samples = samples.shape[0]
         assert samples.shape[1] == len(self.nsoutdims)
@@ -927,26 +1425,20 @@ class MPPovm(mp.MPArray):
             # different from `n_samples = samples.shape[0]` e.g. if
             # counts have been put into the shape of samples.
             n_avg_samples = weights.sum()
-        fun_out = np.zeros((n_funs, n_samples), float)
-        fun_out[:] = np.nan
-        for pos, fun in enumerate(funs):
-            fun_out[pos, :] = fun(samples)
-        # Expectation value of each function
-        w_fun_out = fun_out if weights is None else fun_out * weights[None, :]
-        ept = w_fun_out.sum(1) / n_avg_samples
-        # Covariance matrix of the functions
-        cov = np.dot(fun_out, w_fun_out.T) / n_avg_samples
-        cov -= np.outer(ept, ept)
+        else:
+            weights = np.ones(n_samples, float)
+        fun_out = _eval_funs(funs, samples)
         # - Has the unbiased estimator larger MSE?
         # - Switch from function covariance to function estimate covariance
-        cov *= (n_avg_samples / (n_avg_samples - 1)) / n_avg_samples
+        factor = (n_avg_samples / (n_avg_samples - 1)) / n_avg_samples
         if coeff is None:
-            return ept, cov
+            ept, cov = _lfun_moments(fun_out, weights, n_avg_samples, None)
+            return ept, cov * factor
 
-        # Expectation value / estimate of the linear combination
-        est = np.inner(coeff, ept)
-        # Estimated variance
-        var_est = np.inner(coeff, np.dot(cov, coeff))
+        # Expectation value / estimate of the linear combination and
+        # estimated variance
+        est, var_est = _lfun_moments(fun_out, weights, n_avg_samples, coeff)
+        var_est *= factor
         assert var_est >= -eps
         if var_est < 0:
             var_est = 0
@@ -965,7 +1457,8 @@ class MPPovm(mp.MPArray):
         probabilities specified by `coeff`.
 
         :param est_coeff: Output parameter, tuple of lists
-        :param est_funs: Output parameter, tuple of lists
+        :param est_funs: Output parameter, tuple of
+            :class:`IndicatorTable` instances
         :param MPPovmList other: An MP-POVM list
         :param n_samples: `n_samples[i]` specifies the number of
             samples available for `other.mpps[i]`. They are used for a
@@ -998,9 +1491,7 @@ class MPPovm(mp.MPArray):
                 my_out, out = tuple(outcomes[:n_nsout]), outcomes[n_nsout:]
                 # Append a function which matches on the output `out`
                 # on sites specified by `support`.
-                est_funs[pos].append(
-                    lambda s, out=out[None, :], supp=support:
-                    (s[:, supp] == out).all(1))
+                est_funs[pos].append(support, out)
                 # To compute the final coefficient, we need to know
                 # how many samples from (possibly many) `mpp`s have
                 # contributed to a given probability specified by `my_out`.
@@ -1105,7 +1596,8 @@ class MPPovm(mp.MPArray):
 
         :param MPPovm other: Another MPPovm
         :param np.ndarray samples: `(n_samples, len(other.nsoutdims))`
-            array of samples for `other`
+            array of samples for `other` or a pair `(outcomes,
+            counts)` from :func:`MPPovm.count_samples` on `other`
 
         :returns: `(est_pmf, n_samples_used)`. `est_pmf`: Shape
             `self.nsoutdims` ndarray of normalized probability
@@ -1117,7 +1609,7 @@ class MPPovm(mp.MPArray):
 
         """
         assert len(self) == len(other)
-        n_samples = samples.shape[0]
+        samples, counts, n_samples = self._as_counts(samples)
         assert samples.shape[1] == len(other.nsoutdims)
         match, prefactors = self.match_elems(other)
         other_support = tuple(
@@ -1141,16 +1633,23 @@ class MPPovm(mp.MPArray):
             "Given subset of elements does not sum to multiple of identity; "
             "conversion not possible")
 
+        # Count each outcome of `other` on `other_support` once
         samples = samples[:, other_support]
-        m_shape = (np.prod(self.nsoutdims),) + other_outdims
-        m_pos = (slice(None),) + tuple(samples.T)
-        n_samples_used = match.reshape(m_shape)[m_pos].any(0).sum()
-
-        est_pmf = np.zeros(self.nsoutdims, float)
-        for outcomes in np.argwhere(match):
-            my_out, out = tuple(outcomes[:n_nsout]), outcomes[n_nsout:]
-            count = (samples == out[None, :]).all(1).sum()
-            est_pmf[my_out] += prefactors[tuple(outcomes)] * count / n_samples
+        n_other = int(np.prod(other_outdims))
+        if other_outdims:
+            samples = np.ravel_multi_index(samples.T, other_outdims)
+        else:
+            samples = np.zeros(samples.shape[0], int)
+        out_counts = np.bincount(samples, counts, minlength=n_other)
+        if counts is not None:
+            out_counts = out_counts.astype(counts.dtype)
+        # Probability estimates are weighted sums of the counts
+        m_shape = (int(np.prod(self.nsoutdims)), n_other)
+        weights = np.where(match, prefactors, 0.0).reshape(m_shape)
+        est_pmf = np.dot(weights, out_counts).reshape(self.nsoutdims)
+        est_pmf /= n_samples
+        used = match.reshape(m_shape).any(0)
+        n_samples_used = out_counts[used].sum()
 
         assert abs(est_pmf.sum() - all_prefactor) <= eps
         est_pmf[~given] = np.nan
@@ -1300,39 +1799,108 @@ class MPPovmList:
         for mpp in self.mpps:
             yield mpp.pmf(state, mode)
 
-    def pmf_as_array(self, state, mode='auto', eps=1e-10):
+    def pmf_as_array(self, state, mode='auto', eps=1e-10, impl='auto'):
         """Compute the PMF of all MP-POVMs as full arrays
 
         Parameters: See :func:`MPPovmList.pmf`. Sanity checks: See
         :func:`MPPovm.pmf_as_array`.
 
+        :param impl: `'auto'`, `'shared'` or `'single'`. `'auto'` uses
+            `'shared'` for modes `'mps'` and `'pmps'` and `'single'`
+            otherwise. `'single'` calls :func:`MPPovm.pmf_as_array`
+            for each MP-POVM. `'shared'` contracts the state once for
+            all MP-POVMs which share local tensors on the first or last
+            sites of the chain (see :func:`MPPovmList._pmf_as_array_shared`).
+
         :returns: Iterator over probabilities as ndarrays
 
         """
         assert len(state) == len(self.mpps[0])
-        for mpp in self.mpps:
-            yield mpp.pmf_as_array(state, mode, eps)
+        if impl == 'auto':
+            impl = 'shared' if mode in ('mps', 'pmps') else 'single'
+        if impl == 'single':
+            for mpp in self.mpps:
+                yield mpp.pmf_as_array(state, mode, eps)
+            return
+        if impl != 'shared':
+            raise ValueError('Implementation {!r} unknown'.format(impl))
+        if mode == 'mps':
+            state = mpsmpo.mps_to_pmps(state)
+        else:
+            assert mode == 'pmps', "impl='shared' requires mode 'mps' or 'pmps'"
+        for pmf in self._pmf_as_array_shared(state):
+            yield project_pmf(pmf, eps, eps)
+
+    def _pmf_as_array_shared(self, pmps):
+        """PMFs of all MP-POVMs with shared contractions (PMPS only)
+
+        This function computes the same PMFs as
+        :func:`MPPovm._pmf_as_array_pmps_symm`, i.e. it contracts from
+        both ends of the chain towards the split point of
+        `self.mpps[0]`. On both sides, the partial PMFs of all
+        MP-POVMs are obtained from a trie over their local tensors
+        (:func:`_pmf_prefix_trie`). For e.g. :func:`pauli_mpps`, this
+        replaces `len(self.mpps)` contractions with the state by a
+        number proportional to the square root of `len(self.mpps)`.
+
+        :returns: List of unprojected PMFs
+
+        """
+        if len(pmps) == 1:
+            p = _pmf_prefix_trie([mpp.lt for mpp in self.mpps], pmps.lt)
+            return [x.reshape(mpp.nsoutdims) for x, mpp in zip(p, self.mpps)]
+        n_left = self.mpps[0]._pmps_symm_plan(pmps.ranks)[0]
+        p_left = _pmf_prefix_trie([list(mpp.lt[:n_left]) for mpp in self.mpps],
+                                  list(pmps.lt[:n_left]))
+        rights = [mpp._cached(('reversed', n_left),
+                              lambda mpp=mpp: MPPovm(mpp.lt[n_left:]).reverse())
+                  for mpp in self.mpps]
+        state_right = mp.MPArray(pmps.lt[n_left:]).reverse()
+        p_right = _pmf_prefix_trie([right.lt for right in rights],
+                                   state_right.lt)
+        pmfs = []
+        for mpp, left, right in zip(self.mpps, p_left, p_right):
+            left = left.reshape((left.shape[0], -1))
+            s_right = tuple(d for d in mpp.outdims[:n_left - 1:-1] if d > 1)
+            assert right.shape[0] == np.prod(s_right)
+            right = right.reshape(s_right + (-1,)).transpose()
+            p = np.tensordot(left, right, axes=(1, 0))
+            pmfs.append(p.reshape(mpp.nsoutdims))
+        return pmfs
+
+    def pmfs_as_array(self, states, mode, asarray=False, eps=1e-10,
+                      executor=None, n_workers=None):
+        """Compute the PMF of ``self.mpps[i]`` for ``states[i]``
+
+        Parameters: See :func:`MPPovm.pmfs_as_array`.
 
-    def pmfs_as_array(self, states, mode, asarray=False, eps=1e-10):
-        """.. todo:: Add docstring"""
-        pmfs = (mpp.pmf_as_array(state, mode, eps)
-                for mpp, state in zip(self.mpps, states))
+        """
+        pmfs = mpsmpo._imap(_pmf_as_array, self.mpps, states,
+                            it.repeat(mode), it.repeat(eps),
+                            executor=executor, n_workers=n_workers)
         if asarray:
             pmfs = np.array(list(pmfs))
         return pmfs
 
     def block_pmfs_as_array(self, state, mode, asarray=False, eps=1e-10,
-                            **redarg):
-        """.. todo:: Add docstring"""
+                            executor=None, n_workers=None, **redarg):
+        """Compute the PMF of ``self.mpps[i]`` for the i-th reduced state of
+        `state`
+
+        Parameters: See :func:`MPPovm.block_pmfs_as_array`. If `redarg` is
+        not given, ``self.mpps[i]`` must start on site ``i``.
+
+        """
         if len(redarg) == 0:
             # redarg not given: self.mpps[i] starts on site i
             assert len(self.mpps) == len(state) - len(self.mpps[0]) + 1
             redarg['width'] = len(self.mpps[0])
         states, newmode = mpsmpo.reductions(state, mode, **redarg)
-        return self.pmfs_as_array(states, newmode, asarray, eps)
+        return self.pmfs_as_array(states, newmode, asarray, eps, executor,
+                                  n_workers)
 
     def sample(self, rng, state, n_samples, method, n_group=1, mode='auto',
-               pack=False, eps=1e-10):
+               pack=False, eps=1e-10, n_workers=None, block_size=2**16):
         """Random sample from all MP-POVMs on a quantum state
 
         Parameters: See :func:`MPPovm.sample()`.
@@ -1343,7 +1911,7 @@ class MPPovmList:
         """
         for mpp in self.mpps:
             yield mpp.sample(rng, state, n_samples, method, n_group, mode, pack,
-                             eps)
+                             eps, n_workers=n_workers, block_size=block_size)
 
     def pack_samples(self, samples):
         """Pack samples into one integer per sample
@@ -1365,6 +1933,16 @@ class MPPovmList:
         for s, mpp in zip(samples, self.mpps):
             yield mpp.unpack_samples(s)
 
+    def count_samples(self, samples):
+        """Count distinct outcomes in samples
+
+        :returns: Iterator over output from :func:`MPPovm.count_samples`
+
+        """
+        assert len(samples) == len(self.mpps)
+        for s, mpp in zip(samples, self.mpps):
+            yield mpp.count_samples(s)
+
     def est_pmf(self, samples, normalized=True, eps=1e-10):
         """Estimate PMF from samples
 
@@ -1415,7 +1993,8 @@ class MPPovmList:
         """Estimate a linear combination of functions of POVM outcomes
 
         :param coeff: Iterable of coefficient lists
-        :param funs: Iterable of function lists
+        :param funs: Iterable of function lists or
+            :class:`IndicatorTable` instances
         :param samples: Iterable of samples
         :param weights: Iterable of weight lists or `None`
 
@@ -1458,7 +2037,7 @@ class MPPovmList:
         assert len(coeff) == len(self.mpps)
         # These two have length len(other.mpps)
         est_coeff = tuple([] for _ in range(len(other.mpps)))
-        est_funs = tuple([] for _ in range(len(other.mpps)))
+        est_funs = tuple(IndicatorTable(mpp.nsoutdims) for mpp in other.mpps)
         # This one will have length len(self.mpps) at the end.
         n_sam = []
         for c, mpp in zip(coeff, self.mpps):
@@ -1517,14 +2096,15 @@ class MPPovmList:
         :param MPPovmList other: Another MP-POVM list
         :param coeff: A sequence of shape `self.mpps[i].nsoutdims`
             coefficients which specify the function to estimate
-        :param samples: A sequence of samples for `other`
+        :param samples: A sequence of samples for `other` (or of
+            sparse counts from :func:`MPPovmList.count_samples`)
 
         :returns: `(est, var)`: Estimated value and estimated variance
             of the estimated value. Return `(np.nan, np.nan)` if
             `other` is not sufficient to estimate the function.
 
         """
-        n_samples = [s.shape[0] for s in samples]
+        n_samples = [mpp._as_counts(s)[2] for mpp, s in zip(other.mpps, samples)]
         n_sam, est_coeff, funs = self._lfun_estimator(other, coeff, n_samples, eps)
         # If a single probability cannot be estimated, we cannot return anything.
         if any((n[c != 0.0] == 0).any() for n, c in zip(n_sam, coeff)):
@@ -1535,6 +2115,376 @@ class MPPovmList:
         return sum(est), sum(var)
 
 
+class IndicatorTable:
+
+    """Indicator functions of POVM outcomes on subsets of sites
+
+    The `i`-th function is equal to one if a sample has the outcome
+    `outcomes[i]` on the sites `supports[i]` and zero otherwise. An
+    instance can be passed as `funs` to :func:`MPPovm.lfun`,
+    :func:`MPPovm.est_lfun` and the corresponding methods of
+    :class:`MPPovmList`. Functions with the same support are evaluated
+    together by looking up packed samples in the sorted packed
+    outcomes, which avoids one pass over all samples per function.
+
+    >>> p = pauli_mpp(nr_sites=2, local_dim=2)
+    >>> funs = IndicatorTable(p.nsoutdims)
+    >>> funs.append((0,), [1])
+    >>> funs.append((0, 1), [1, 2])
+    >>> funs.indicators(np.array([[1, 2], [1, 0], [0, 2]])).toarray()
+    array([[1., 1., 0.],
+           [1., 0., 0.]])
+
+    Iterating over an instance yields the functions as Python
+    callables.
+
+    .. automethod:: __init__
+
+    """
+
+    def __init__(self, nsoutdims):
+        """Construct an empty table
+
+        :param nsoutdims: Non-singleton outcome dimensions of the
+            POVM, i.e. `MPPovm.nsoutdims`
+
+        """
+        self.nsoutdims = tuple(nsoutdims)
+        self._len = 0
+        # support -> (list of function indices, list of outcome arrays)
+        self._groups = collections.OrderedDict()
+
+    @classmethod
+    def all_outcomes(cls, nsoutdims):
+        """Indicator functions for all outcomes in C order
+
+        These functions provide the POVM probabilities; they are used
+        for `funs=None` in :func:`MPPovm.est_lfun`.
+
+        """
+        table = cls(nsoutdims)
+        n_out = int(np.prod(table.nsoutdims))
+        outcomes = np.array(np.unravel_index(range(n_out), table.nsoutdims))
+        table.extend(range(len(table.nsoutdims)), outcomes.T)
+        return table
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        funs = [None] * len(self)
+        for support, (index, outcomes) in self._groups.items():
+            for pos, out in zip(np.concatenate(index),
+                                np.concatenate(outcomes)):
+                funs[pos] = (lambda s, out=out[None, :], supp=list(support):
+                             (s[:, supp] == out).all(1))
+        return iter(funs)
+
+    def append(self, support, outcome):
+        """Append one indicator function
+
+        :param support: Positions in `nsoutdims`
+        :param outcome: Length `len(support)` outcome on `support`
+
+        """
+        self.extend(support, np.asarray(outcome)[None, :])
+
+    def extend(self, support, outcomes):
+        """Append indicator functions with the same support
+
+        :param support: Positions in `nsoutdims`
+        :param outcomes: Shape `(n_funs, len(support))` array
+
+        """
+        support = tuple(support)
+        outcomes = np.asarray(outcomes)
+        assert outcomes.ndim == 2
+        assert outcomes.shape[1] == len(support)
+        index, outs = self._groups.setdefault(support, ([], []))
+        index.append(np.arange(self._len, self._len + len(outcomes)))
+        outs.append(outcomes)
+        self._len += len(outcomes)
+
+    def indicators(self, samples):
+        """Evaluate all functions on samples
+
+        :param np.ndarray samples: `(n_samples, len(self.nsoutdims))`
+            array of samples
+        :returns: Sparse `(len(self), n_samples)` matrix
+            (:class:`scipy.sparse.csr_matrix`) of function values
+
+        """
+        assert samples.ndim == 2
+        assert samples.shape[1] == len(self.nsoutdims)
+        n_samples = samples.shape[0]
+        rows, cols = [np.zeros(0, int)], [np.zeros(0, int)]
+        for support, (index, outcomes) in self._groups.items():
+            dims = tuple(self.nsoutdims[pos] for pos in support)
+            index = np.concatenate(index)
+            keys = _pack_rows(np.concatenate(outcomes), dims)
+            order = np.argsort(keys, kind='mergesort')
+            keys = keys[order]
+            s_keys = _pack_rows(samples[:, list(support)], dims)
+            start = np.searchsorted(keys, s_keys, 'left')
+            n_match = np.searchsorted(keys, s_keys, 'right') - start
+            # A sample matches more than one function only if the
+            # table contains the same function more than once.
+            first = np.repeat(np.cumsum(n_match) - n_match, n_match)
+            offset = np.arange(n_match.sum()) - first
+            rows.append(index[order[np.repeat(start, n_match) + offset]])
+            cols.append(np.repeat(np.arange(n_samples), n_match))
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        return sp.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                             shape=(len(self), n_samples))
+
+
+def _pack_rows(rows, dims):
+    """Pack each row of outcomes on sites with dimensions `dims`"""
+    if not dims:
+        return np.zeros(rows.shape[0], int)
+    return np.ravel_multi_index(rows.T, dims)
+
+
+def _eval_funs(funs, samples):
+    """Values of `funs` on `samples` as `(n_funs, n_samples)` array
+
+    Returns a sparse matrix for an :class:`IndicatorTable`.
+
+    """
+    if isinstance(funs, IndicatorTable):
+        return funs.indicators(samples)
+    fun_out = np.zeros((len(funs), samples.shape[0]), float)
+    fun_out[:] = np.nan
+    for pos, fun in enumerate(funs):
+        fun_out[pos, :] = fun(samples)
+    return fun_out
+
+
+def _lfun_moments(fun_out, weights, n_avg, coeff):
+    """Weighted averages and covariance of function values
+
+    :param fun_out: Dense or sparse `(n_funs, n_points)` array of
+        function values
+    :param weights: Length `n_points` weights (probabilities or counts)
+    :param n_avg: Sum of the weights
+    :param coeff: Coefficients of a linear combination or `None`
+
+    :returns: `(ept, cov)` for all functions if `coeff` is `None`,
+        else expectation value and variance of the linear combination
+
+    """
+    ept = fun_out.dot(weights) / n_avg
+    if coeff is None:
+        w_fun_out = (sp.diags(weights).dot(fun_out.T) if sp.issparse(fun_out)
+                     else fun_out.T * weights[:, None])
+        cov = fun_out.dot(w_fun_out)
+        if sp.issparse(cov):
+            cov = cov.toarray()
+        return ept, cov / n_avg - np.outer(ept, ept)
+    # The linear combination is one function; its variance does not
+    # require the full covariance matrix.
+    values = fun_out.T.dot(coeff)
+    est = np.inner(coeff, ept)
+    return est, np.inner(weights, values**2) / n_avg - est**2
+
+
+def _pmf_state_step(p, pmps_lt):
+    """Contract one PMPS site into a partial PMF
+
+    See :func:`MPPovm._pmf_as_array_pmps_ltr` for the tensor network.
+
+    """
+    # Axes: 0 probab, 1 POVM leg , 2 PMPS leg , 3 PMPS-cc leg
+    p = np.tensordot(p, pmps_lt, axes=(2, 0))
+    # 0 probab, 1 POVM bd, 2 PMPS-cc bd, 3 system, 4 ancilla, 5 PMPS bd
+    p = np.tensordot(p, pmps_lt.conj(), axes=((2, 4), (0, 2)))
+    # 0 probab, 1 POVM bd, 2 system, 3 PMPS bd, 4 system', 5 PMPS-cc bd
+    return p
+
+
+def _pmf_povm_step(p, povm_lt):
+    """Contract one MP-POVM site into the output of :func:`_pmf_state_step`
+
+    `povm_lt` may contain the local tensors of several MP-POVMs
+    concatenated along the outcome axis.
+
+    """
+    # NB: We basically transpose povm_lt by specifying suitable axes.
+    # The transpose is explained in localpovm.POVM.probability_map.
+    p = np.tensordot(p, povm_lt, axes=((1, 2, 4), (0, 3, 2)))
+    # 0 probab, 1 PMPS leg , 2 PMPS-cc leg , 3 probab', 4 POVM leg
+    p = p.transpose((0, 3, 4, 1, 2))
+    # 0 probab, 1 probab', 2 POVM leg , 3 PMPS leg , 4 PMPS-cc leg
+    s = p.shape
+    # Return axes: 0 probab, 1 POVM leg , 2 PMPS leg , 3 PMPS-cc leg
+    return p.reshape((s[0] * s[1], s[2], s[3], s[4]))
+
+
+def _pmf_prefix_trie(povm_ltens, pmps_ltens):
+    """Partial PMFs of several MP-POVMs with shared prefixes
+
+    Computes :func:`MPPovm._pmf_as_array_pmps_ltr(pmps, partial=True)
+    <MPPovm._pmf_as_array_pmps_ltr>` for all MP-POVMs at once: MP-POVMs
+    with equal local tensors on the first `k` sites share the partial
+    PMF on these sites (i.e. the partial PMFs form a trie). The state
+    is contracted once per node of the trie and all distinct POVM local
+    tensors below a node are applied in one batch.
+
+    :param povm_ltens: List of local tensor lists (one per MP-POVM)
+    :param pmps_ltens: Local tensors of the PMPS
+    :returns: List of partial PMFs (one per MP-POVM)
+
+    """
+    result = [None] * len(povm_ltens)
+    # Stack of (partial PMF, MP-POVM indices, site)
+    stack = [(np.ones((1, 1, 1, 1), dtype=float), range(len(povm_ltens)), 0)]
+    while stack:
+        p, members, site = stack.pop()
+        if site == len(pmps_ltens):
+            for pos in members:
+                result[pos] = p
+            continue
+        p = _pmf_state_step(p, pmps_ltens[site])
+        # Distinct local tensors below this node. POVM local tensors
+        # are small, which makes hashing their content cheap.
+        children = collections.OrderedDict()
+        for pos in members:
+            lt = povm_ltens[pos][site]
+            key = (lt.shape, lt.dtype.str, lt.tobytes())
+            children.setdefault(key, (lt, []))[1].append(pos)
+        # Local tensors with equal right rank can be applied together
+        batches = collections.OrderedDict()
+        for lt, child in children.values():
+            batches.setdefault(lt.shape[-1], []).append((lt, child))
+        for batch in batches.values():
+            lts, child_members = zip(*batch)
+            p_all = _pmf_povm_step(p, np.concatenate(lts, axis=1))
+            # Outcomes of the different local tensors are consecutive
+            # blocks along the first axis of `p_all`.
+            p_all = p_all.reshape((p.shape[0], -1) + p_all.shape[1:])
+            start = 0
+            for lt, child in zip(lts, child_members):
+                stop = start + lt.shape[1]
+                child_p = p_all[:, start:stop]
+                child_p = child_p.reshape((-1,) + child_p.shape[2:])
+                stack.append((child_p, child, site + 1))
+                start = stop
+    return result
+
+
+def _block_seeds(rng, n_blocks):
+    """Independent seeds for `n_blocks` random number streams"""
+    def seed():
+        return rng.randint(2**32, size=4, dtype=np.int64).astype(np.uint32)
+
+    if hasattr(np.random, 'SeedSequence'):
+        children = np.random.SeedSequence(seed()).spawn(n_blocks)
+        return [child.generate_state(4) for child in children]
+    return [seed() for _ in range(n_blocks)]
+
+
+def _sample_block(sampler, out, valid, task):
+    start, stop, seed = task
+    MPPovm._sample_draw(np.random.RandomState(seed), sampler, stop - start,
+                        out[start:stop], valid[start:stop])
+
+
+# Arguments of the current worker process, see :func:`_sample_chunks`
+_SAMPLE_WORKER = {}
+
+
+def _shared_array(shape, dtype, buf=None):
+    """Array in shared memory (new if `buf` is `None`) and its buffer"""
+    import multiprocessing
+    if buf is None:
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        buf = multiprocessing.RawArray('B', nbytes)
+    return np.frombuffer(buf, dtype=dtype).reshape(shape), buf
+
+
+def _init_sample_worker(sampler, bufs, shape, dtype):
+    out, _ = _shared_array(shape, dtype, bufs[0])
+    valid, _ = _shared_array(shape, bool, bufs[1])
+    _SAMPLE_WORKER.update(sampler=sampler, out=out, valid=valid)
+
+
+def _sample_worker(task):
+    _sample_block(_SAMPLE_WORKER['sampler'], _SAMPLE_WORKER['out'],
+                  _SAMPLE_WORKER['valid'], task)
+
+
+def _block_tasks(rng, n_samples, block_size):
+    """Blocks of `block_size` samples with one seed each"""
+    starts = range(0, n_samples, block_size)
+    return [(start, min(start + block_size, n_samples), seed)
+            for start, seed in zip(starts, _block_seeds(rng, len(starts)))]
+
+
+def _sample_chunks(sampler, rng, sizes, n_cols, dtype, block_size,
+                   n_workers):
+    """Sample in blocks with one random number stream per block
+
+    See :func:`MPPovm.sample` for a description. If `n_workers` is
+    `None`, samples are drawn from `rng` directly. All chunks are sampled
+    in the same process pool.
+
+    :param sampler: Sampler from :func:`MPPovm._sample_setup`
+    :param sizes: Number of samples in each chunk
+    :returns: Iterator over the samples of each chunk
+
+    If there is a single chunk and a process pool is used, the samples
+    are returned in the shared memory the workers wrote them to.
+    Otherwise, the shared memory is reused for the next chunk and the
+    samples are copied.
+
+    """
+    if n_workers is None:
+        for n_samples in sizes:
+            out = np.zeros((n_samples, n_cols), dtype=dtype)
+            # All values of `dtype` can be outcomes. Missing data is
+            # recorded separately.
+            valid = np.zeros((n_samples, n_cols), dtype=bool)
+            MPPovm._sample_draw(rng, sampler, n_samples, out, valid)
+            assert valid.all(), "Some outcomes have not been sampled"
+            yield out
+        return
+
+    if n_workers <= 1 or max([0] + sizes) <= block_size:
+        for n_samples in sizes:
+            out = np.zeros((n_samples, n_cols), dtype=dtype)
+            valid = np.zeros((n_samples, n_cols), dtype=bool)
+            for task in _block_tasks(rng, n_samples, block_size):
+                _sample_block(sampler, out, valid, task)
+            assert valid.all(), "Some outcomes have not been sampled"
+            yield out
+        return
+
+    import multiprocessing
+    shape = (max(sizes), n_cols)
+    out, out_buf = _shared_array(shape, dtype)
+    valid, valid_buf = _shared_array(shape, bool)
+    pool = multiprocessing.Pool(n_workers, _init_sample_worker,
+                                (sampler, (out_buf, valid_buf), shape, dtype))
+    try:
+        for n_samples in sizes:
+            out[:n_samples], valid[:n_samples] = 0, False
+            pool.map(_sample_worker, _block_tasks(rng, n_samples, block_size),
+                     chunksize=1)
+            assert valid[:n_samples].all(), \
+                "Some outcomes have not been sampled"
+            # `out` keeps the shared memory alive after the pool is closed
+            yield out[:n_samples] if len(sizes) == 1 \
+                else out[:n_samples].copy()
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _pmf_as_array(mpp, state, mode, eps):
+    """Module-level (i.e. picklable) shortcut for :func:`MPPovm.pmf_as_array`"""
+    return mpp.pmf_as_array(state, mode, eps)
+
+
 def pauli_mpp(nr_sites, local_dim):
     r"""Pauli POVM tensor product as MP-POVM
 
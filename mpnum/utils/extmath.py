@@ -5,11 +5,13 @@ from __future__ import division, print_function
 
 import numpy as np
 from scipy import linalg
-from scipy.sparse.linalg import aslinearoperator
+from scipy import sparse
+from scipy.sparse.linalg import aslinearoperator, svds
 from six.moves import range, zip
 
-__all__ = ['block_diag', 'matdot', 'mkron', 'partial_trace',
-           'truncated_svd', 'randomized_svd']
+__all__ = ['block_diag', 'matdot', 'mkron', 'partial_trace', 'tensordot',
+           'truncated_svd', 'economical_svd', 'partial_svd',
+           'randomized_svd', 'auto_svd', 'SVD_BACKENDS']
 
 
 def partial_trace(array, traceout):
@@ -104,6 +106,63 @@ def block_diag(summands, axes=(0, 1)):
     return res
 
 
+#: Arrays with at least this many entries are checked for sparsity by
+#: :func:`tensordot`
+SPARSE_MIN_SIZE = 4096
+#: :func:`tensordot` uses a sparse matrix product if the fraction of non-zero
+#: entries of one factor is at most this value
+SPARSE_MAX_DENSITY = 0.1
+
+
+def _is_sparse(array):
+    return array.size >= SPARSE_MIN_SIZE and \
+        np.count_nonzero(array) <= SPARSE_MAX_DENSITY * array.size
+
+
+def tensordot(a, b, axes=2):
+    """Same as :func:`numpy.tensordot`, but skips the zero entries of
+    mostly-zero factors
+
+    MPOs built from :func:`mpnum.local_sum` and similar functions have local
+    tensors which consist mostly of zero blocks. If one of the two factors
+    has at least :data:`SPARSE_MIN_SIZE` entries of which a fraction of at
+    most :data:`SPARSE_MAX_DENSITY` is non-zero, it is converted to a
+    :class:`scipy.sparse.csr_matrix` and the contraction is carried out as
+    a sparse-dense matrix product. The result is always a dense array.
+
+    >>> a = np.zeros((64, 2, 2, 64)); a[:, 0, 0, :] = np.eye(64)
+    >>> b = np.ones((64, 2, 3))
+    >>> np.allclose(tensordot(a, b, ((0, 1), (0, 1))),
+    ...             np.tensordot(a, b, ((0, 1), (0, 1))))
+    True
+
+    """
+    a_sparse, b_sparse = _is_sparse(a), _is_sparse(b)
+    if not (a_sparse or b_sparse):
+        return np.tensordot(a, b, axes)
+
+    try:
+        axes_a, axes_b = axes
+    except TypeError:
+        axes_a = list(range(a.ndim - axes, a.ndim))
+        axes_b = list(range(axes))
+    axes_a = [ax % a.ndim for ax in np.atleast_1d(axes_a)]
+    axes_b = [ax % b.ndim for ax in np.atleast_1d(axes_b)]
+    free_a = [ax for ax in range(a.ndim) if ax not in axes_a]
+    free_b = [ax for ax in range(b.ndim) if ax not in axes_b]
+    shape = tuple(a.shape[ax] for ax in free_a) + \
+        tuple(b.shape[ax] for ax in free_b)
+    csize = int(np.prod([a.shape[ax] for ax in axes_a]))
+
+    mat_a = a.transpose(free_a + axes_a).reshape((-1, csize))
+    mat_b = b.transpose(axes_b + free_b).reshape((csize, -1))
+    if a_sparse:
+        res = sparse.csr_matrix(mat_a).dot(mat_b)
+    else:
+        res = sparse.csr_matrix(mat_b.T).dot(mat_a.T).T
+    return np.asarray(res).reshape(shape)
+
+
 def truncated_svd(A, k):
     """Compute the truncated SVD of the matrix `A` i.e. the `k` largest
     singular values as well as the corresponding singular vectors. It might
@@ -126,6 +185,38 @@ def truncated_svd(A, k):
     return u[:, :k_prime], s[:k_prime], v[:k_prime]
 
 
+def economical_svd(A, k):
+    """Same as :func:`truncated_svd`, but only computes the economic SVD
+    (i.e. :code:`full_matrices=False`). The singular vectors which are
+    discarded anyway are never computed, which makes a big difference for
+    strongly non-square matrices.
+
+    Parameters and return value: See :func:`truncated_svd`.
+
+    """
+    u, s, v = np.linalg.svd(A, full_matrices=False)
+    k_prime = min(k, len(s))
+    return u[:, :k_prime], s[:k_prime], v[:k_prime]
+
+
+def partial_svd(A, k):
+    """Computes the `k` largest singular values and vectors of `A` using
+    :func:`scipy.sparse.linalg.svds`. In contrast to the latter, the singular
+    values are returned in descending order.
+
+    Since ``svds`` requires ``k < min(A.shape)``, we fall back to
+    :func:`economical_svd` if more singular values are requested.
+
+    Parameters and return value: See :func:`truncated_svd`.
+
+    """
+    if k >= min(A.shape):
+        return economical_svd(A, k)
+    u, s, v = svds(A, k=k)
+    order = np.argsort(s)[::-1]
+    return u[:, order], s[order], v[order]
+
+
 ####################
 #  Randomized SVD  #
 ####################
@@ -155,7 +246,7 @@ def _standard_normal(shape, randstate=np.random, dtype=np.float_):
 
 
 def approx_range_finder(A, sketch_size, n_iter, piter_normalizer='auto',
-                        randstate=np.random):
+                        randstate=np.random, sketch=None):
     """Computes an orthonormal matrix whose range approximates the range of A.
 
     Parameters
@@ -174,6 +265,10 @@ def approx_range_finder(A, sketch_size, n_iter, piter_normalizer='auto',
         normalization if `n_iter`<=2 and switches to LU otherwise.
     :param randstate: An instance of :class:`numpy.random.RandomState` (default is
         ``np.random``))
+    :param sketch: Start matrix with ``A.shape[1]`` rows used instead of
+        (the first columns of) the random test matrix, e.g. the right singular
+        vectors of a similar matrix. Missing columns are filled with random
+        vectors. (default ``None``)
 
     Returns
     -------
@@ -199,7 +294,14 @@ def approx_range_finder(A, sketch_size, n_iter, piter_normalizer='auto',
     A = aslinearoperator(A)
 
     # note that real normal vectors might actually be sufficient
-    Q = _standard_normal((A.shape[1], sketch_size), randstate=randstate, dtype=A.dtype)
+    if sketch is None:
+        Q = _standard_normal((A.shape[1], sketch_size), randstate=randstate,
+                             dtype=A.dtype)
+    else:
+        sketch = sketch[:, :sketch_size]
+        fill = _standard_normal((A.shape[1], sketch_size - sketch.shape[1]),
+                                randstate=randstate, dtype=A.dtype)
+        Q = np.concatenate((sketch, fill), axis=1)
 
     # Deal with "auto" mode
     if piter_normalizer == 'auto':
@@ -228,7 +330,8 @@ def approx_range_finder(A, sketch_size, n_iter, piter_normalizer='auto',
 
 
 def randomized_svd(M, n_components, n_oversamples=10, n_iter='auto',
-                   piter_normalizer='auto', transpose='auto', randstate=np.random):
+                   piter_normalizer='auto', transpose='auto', randstate=np.random,
+                   sketch=None):
     """Computes a truncated randomized SVD. Uses the same convention as
     :func:`scipy.sparse.linalg.svds`. However, we guarantee to return the
     singular values in descending order.
@@ -264,6 +367,12 @@ def randomized_svd(M, n_components, n_oversamples=10, n_iter='auto',
         (default ``'auto'``).
     :param randstate: An instance of :class:`numpy.random.RandomState` (default is
         ``np.random``))
+    :param sketch: Warm start for the range finder: Matrix with ``M.shape[1]``
+        rows whose range approximates the dominant right singular vectors of
+        ``M``, e.g. ``v.conj().T`` from a previous call on a similar matrix.
+        Passing a sketch disables automatic transposition and reduces the
+        ``'auto'`` number of power iterations to 2. A sketch with the wrong
+        number of rows is ignored. (default ``None``)
 
     .. rubric:: Notes
 
@@ -289,18 +398,24 @@ def randomized_svd(M, n_components, n_oversamples=10, n_iter='auto',
     """
     M = aslinearoperator(M)
     sketch_size = n_components + n_oversamples
+    if sketch is not None and sketch.shape[0] != M.shape[1]:
+        sketch = None
 
     if n_iter == 'auto':
         # Checks if the number of iterations is explicitely specified
         # Adjust n_iter. 7 was found a good compromise for PCA.
         n_iter = 7 if n_components < .1 * min(M.shape) else 4
+        # A good start matrix needs fewer power iterations
+        n_iter = n_iter if sketch is None else 2
 
     if transpose == 'auto':
-        transpose = M.shape[0] < M.shape[1]
+        transpose = sketch is None and M.shape[0] < M.shape[1]
     if transpose:
+        assert sketch is None, "Cannot use sketch with transpose=True"
         M = M.H
 
-    Q = approx_range_finder(M, sketch_size, n_iter, piter_normalizer, randstate)
+    Q = approx_range_finder(M, sketch_size, n_iter, piter_normalizer, randstate,
+                            sketch)
     # project M to the (k + p) dimensional space using the basis vectors
     # B = Q.H * M
     B = (M.H * Q).conj().T
@@ -316,3 +431,39 @@ def randomized_svd(M, n_components, n_oversamples=10, n_iter='auto',
         return (V[sel].conj().T, s[sel], U[:, sel].conj().T)
     else:
         return U[:, sel], s[sel], V[sel, :]
+
+
+def auto_svd(A, k, sketch=None, n_oversamples=10, min_dim=100):
+    """Truncated SVD which chooses the implementation from the shape of `A`
+    and the number of requested singular values:
+
+    * :func:`economical_svd` if `A` is small (``min(A.shape) < min_dim``) or
+      if the truncation discards less than three quarters of the spectrum
+    * :func:`randomized_svd` otherwise, i.e. if only a small fraction of a
+      large spectrum is kept
+
+    :param A: A real or complex matrix
+    :param k: Number of singular values/vectors to compute
+    :param sketch: Passed to :func:`randomized_svd` (default ``None``)
+    :param n_oversamples: Passed to :func:`randomized_svd` (default 10)
+    :param min_dim: Matrices with smaller dimension are always decomposed
+        with a dense SVD (default 100)
+    :returns: u, s, v; see :func:`truncated_svd`
+
+    """
+    dim = min(A.shape)
+    if dim < min_dim or 4 * (k + n_oversamples) > dim:
+        return economical_svd(A, k)
+    return randomized_svd(A, k, n_oversamples=n_oversamples, sketch=sketch)
+
+
+#: Truncated SVD implementations available by name, e.g. for
+#: :func:`mpnum.mparray.MPArray.compress`. All of them follow the
+#: conventions of :func:`truncated_svd`.
+SVD_BACKENDS = {
+    'full': truncated_svd,
+    'economical': economical_svd,
+    'partial': partial_svd,
+    'randomized': randomized_svd,
+    'auto': auto_svd,
+}
@@ -148,6 +148,15 @@ def mpo_cH(terms):
        (in :code:`nr_sites`) small. This would eventually cause
        numerical underflows.
 
+       Use :func:`mp.local_sum_compression()` to reduce the rank of the
+       Hamiltonian instead, which avoids both problems:
+
+       >>> mpoH = mpo_cH(cXY_local_terms(nr_sites=100, gamma=0))
+       >>> compr = mp.local_sum_compression(mpoH)
+       >>> abs3 = max(abs(lt).max() for lt in compr.lt)
+       >>> print(mpoH.ranks[:3], compr.ranks[:3], abs3 < 10)
+       (5, 6, 6) (3, 6, 6) True
+
     """
     H = mp.local_sum(terms[:-1])
     # The last term acts on the first and last site.
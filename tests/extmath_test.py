@@ -112,3 +112,55 @@ def test_randomized_svd(rows, cols, rank, dtype, transpose, n_iter, target_gen,
     assert_allclose(s.ravel() - s_ref, 0, atol=1e-3)
     # Check that singular values are returned in descending order
     assert_array_equal(s, np.sort(s)[::-1])
+
+
+@pt.mark.parametrize('rows, cols', TESTARGS_MATRIXDIMS)
+@pt.mark.parametrize('dtype', pt.MP_TEST_DTYPES)
+@pt.mark.parametrize('backend', sorted(em.SVD_BACKENDS))
+def test_svd_backends(rows, cols, dtype, backend, rgen):
+    rank = 5
+    A = mptest.random_lowrank(rows, cols, rank=rank, randstate=rgen,
+                              dtype=dtype)
+    U_ref, s_ref, V_ref = utils.truncated_svd(A, k=rank)
+    U, s, V = em.SVD_BACKENDS[backend](A, rank)
+
+    assert U.shape == U_ref.shape
+    assert V.shape == V_ref.shape
+    assert_allclose(s, s_ref, atol=1e-8)
+    assert_array_equal(s, np.sort(s)[::-1])
+    assert_allclose((U * s).dot(V), A, atol=1e-8)
+
+
+@pt.mark.parametrize('dtype', pt.MP_TEST_DTYPES)
+def test_randomized_svd_sketch(dtype, rgen):
+    rank = 5
+    A = mptest.random_lowrank(100, 60, rank=rank, randstate=rgen, dtype=dtype)
+    _, _, V = em.randomized_svd(A, rank, randstate=rgen)
+    B = A + 1e-6 * mptest.random_lowrank(100, 60, rank=rank, randstate=rgen,
+                                         dtype=dtype)
+
+    _, s_ref, _ = utils.truncated_svd(B, k=rank)
+    U, s, V = em.randomized_svd(B, rank, n_iter=0, randstate=rgen,
+                                sketch=V.conj().T)
+    assert_allclose(s, s_ref, rtol=1e-6)
+    # sketch with wrong shape is ignored
+    U, s, V = em.randomized_svd(B, rank, randstate=rgen,
+                                sketch=np.zeros((3, rank)))
+    assert_allclose(s, s_ref, rtol=1e-6)
+
+
+@pt.mark.parametrize('axes', [((0, 1), (0, 1)), ((1, 0), (1, 0)),
+                              ((-1,), (0,)), 1, 0])
+@pt.mark.parametrize('sparse_arg', [0, 1])
+@pt.mark.parametrize('dtype', pt.MP_TEST_DTYPES)
+def test_tensordot_sparse(axes, sparse_arg, dtype, rgen, monkeypatch):
+    monkeypatch.setattr(em, 'SPARSE_MIN_SIZE', 10)
+    randfunc = factory._randfuncs[dtype]
+    arrays = [randfunc((4, 4, 4), randstate=rgen) for _ in range(2)]
+    arrays[sparse_arg][arrays[sparse_arg].real < 1] = 0
+    arrays[sparse_arg][1:] = 0
+    assert em._is_sparse(arrays[sparse_arg])
+
+    result = em.tensordot(arrays[0], arrays[1], axes)
+    assert_array_almost_equal(result, np.tensordot(arrays[0], arrays[1], axes))
+    assert result.dtype == dtype
@@ -9,6 +9,7 @@ from numpy.testing import assert_array_almost_equal
 
 import mpnum.factory as factory
 from mpnum._testing import assert_correct_normalization
+from mpnum.utils import mkron
 
 
 @pt.mark.parametrize('nr_sites, local_dim, rank', [(2, 3, 3), (3, 2, 4),
@@ -44,3 +45,68 @@ def test_diagonal_mpa(nr_sites, local_dim, _, rgen, dtype):
 
     if nr_sites > 1:
         assert max(mpa_mp.ranks) == local_dim
+
+
+def _dense_term(nr_sites, ldim, sites, ops):
+    factors = [np.eye(ldim)] * nr_sites
+    for site, op in zip(sites, ops):
+        factors[site] = op
+    return mkron(*factors)
+
+
+@pt.mark.parametrize('nr_sites, local_dim', [(1, 3), (4, 2), (6, 2), (5, 3)])
+@pt.mark.parametrize('dtype', pt.MP_TEST_DTYPES)
+def test_mpo_builder(nr_sites, local_dim, dtype, rgen):
+    randfunc = factory._randfuncs[dtype]
+    builder = factory.MPOBuilder(nr_sites, local_dim)
+    expected = 0
+    for _ in range(8):
+        width = rgen.randint(1, nr_sites + 1)
+        sites = np.sort(rgen.choice(nr_sites, width, replace=False))
+        ops = [randfunc((local_dim, local_dim), randstate=rgen)
+               for _ in range(width)]
+        coeff = rgen.randn()
+        builder.add_term(sites, ops, coeff)
+        expected += coeff * _dense_term(nr_sites, local_dim, sites, ops)
+        # The same term again, which shares all automaton states
+        builder.add_term(sites, ops, 2 * coeff)
+        expected += 2 * coeff * _dense_term(nr_sites, local_dim, sites, ops)
+
+    mpo = builder.to_mpo()
+    assert mpo.dtype == dtype
+    assert len(mpo) == nr_sites
+    assert_array_almost_equal(mpo.to_array_global().reshape(expected.shape),
+                              expected)
+    assert max(mpo.ranks + (0,)) <= 8 * nr_sites + 2
+
+
+@pt.mark.parametrize('nr_sites', [2, 5])
+def test_mpo_builder_exp_decay(nr_sites, rgen):
+    ldim = 2
+    op_a, op_b = rgen.randn(2, ldim, ldim)
+    builder = factory.MPOBuilder(nr_sites, ldim)
+    builder.add_exp_decay(op_a, op_b, coeff=0.7, decay=0.5)
+    builder.add_exp_decay(op_a, op_a, coeff=0.3, decay=0.5)
+    expected = 0
+    for i in range(nr_sites):
+        for j in range(i + 1, nr_sites):
+            term = _dense_term(nr_sites, ldim, (i, j), (op_a, op_b))
+            expected += 0.7 * 0.5**(j - i - 1) * term
+            term = _dense_term(nr_sites, ldim, (i, j), (op_a, op_a))
+            expected += 0.3 * 0.5**(j - i - 1) * term
+
+    mpo = builder.to_mpo()
+    assert max(mpo.ranks) <= 3
+    assert_array_almost_equal(mpo.to_array_global().reshape(expected.shape),
+                              expected)
+
+
+def test_mpo_builder_nearest_neighbour(rgen):
+    nr_sites = 50
+    ops = rgen.randn(3, 2, 2)
+    builder = factory.MPOBuilder(nr_sites, 2)
+    for i in range(nr_sites - 1):
+        builder.add_term((i, i + 1), ops[:2], rgen.randn())
+        builder.add_term((i, i + 1), ops[1:], rgen.randn())
+    mpo = builder.to_mpo()
+    assert max(mpo.ranks) == 4
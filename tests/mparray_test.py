@@ -421,6 +421,26 @@ def test_sandwich(nr_sites, local_dim, rank, rgen, dtype):
     assert_almost_equal(res_sandwich, res_arr)
 
 
+@pt.mark.parametrize('dtype', pt.MP_TEST_DTYPES)
+def test_sandwich_sparse_mpo(dtype, rgen, monkeypatch):
+    # Force the sparse code path for the mostly-zero local tensors
+    monkeypatch.setattr(utils.extmath, 'SPARSE_MIN_SIZE', 1)
+    monkeypatch.setattr(utils.extmath, 'SPARSE_MAX_DENSITY', 0.9)
+    nr_sites, local_dim = 5, 2
+    terms = [factory.random_mpa(2, [local_dim] * 2, 1, randstate=rgen,
+                                dtype=dtype) for _ in range(nr_sites - 1)]
+    mpo = mp.local_sum(terms)
+    mps = factory.random_mpa(nr_sites, local_dim, 3, randstate=rgen,
+                             dtype=dtype, normalized=True)
+
+    vec = mps.to_array().ravel()
+    op = mpo.to_array_global().reshape([local_dim**nr_sites] * 2)
+    res_arr = np.vdot(vec, np.dot(op, vec))
+    assert_array_almost_equal(mp.dot(mpo, mps).to_array().ravel(),
+                              np.dot(op, vec))
+    assert_almost_equal(mp.sandwich(mpo, mps), res_arr)
+
+
 @pt.mark.parametrize('dtype', pt.MP_TEST_DTYPES)
 @pt.mark.parametrize('nr_sites, local_dim, rank', pt.MP_TEST_PARAMETERS)
 def test_norm(nr_sites, local_dim, rank, dtype, rgen):
@@ -808,6 +828,35 @@ def test_local_sum(nr_sites, local_dim, rank, local_width, dtype, rgen):
     assert_array_almost_equal(mpa_local_sum.to_array(), mpa_sum.to_array())
 
 
+@pt.mark.parametrize('dtype', pt.MP_TEST_DTYPES)
+@pt.mark.parametrize('nr_sites, local_dim, local_width',
+                     [(5, 2, 1), (6, 2, 2), (4, 3, 2)])
+def test_local_sum_compression(nr_sites, local_dim, local_width, dtype, rgen):
+    # rank-two terms; their sum has operator Schmidt rank 2 + 2
+    term = factory.random_mpa(local_width, (local_dim,) * 2, 1, dtype=dtype,
+                              randstate=rgen)
+    term += factory.random_mpa(local_width, (local_dim,) * 2, 1, dtype=dtype,
+                               randstate=rgen)
+    mpo = mp.local_sum([term] * (nr_sites - local_width + 1))
+    compr = mp.local_sum_compression(mpo)
+
+    assert_array_almost_equal(compr.to_array(), mpo.to_array())
+    assert all(d1 <= d2 for d1, d2 in zip(compr.ranks, mpo.ranks))
+    assert max(compr.ranks) <= 2 + local_width * 2
+    assert compr.dtype == dtype
+
+
+@pt.mark.long
+def test_local_sum_compression_long_chain():
+    # Canonicalizing this MPO directly overflows (see `physics.mpo_cH`)
+    pauli_z = mp.MPArray.from_array(np.diag([1., -1.]), ndims=2)
+    mpo = mp.local_sum([mp.chain([pauli_z] * 2)] * 2999)
+    compr = mp.local_sum_compression(mpo)
+    assert max(compr.ranks) == 3
+    assert all(np.isfinite(lt).all() for lt in compr.lt)
+    assert max(abs(lt).max() for lt in compr.lt) < 100
+
+
 @pt.mark.parametrize('nr_sites, local_dim, rank', pt.MP_TEST_PARAMETERS)
 def test_diag_1pleg(nr_sites, local_dim, rank, rgen):
     mpa = factory.random_mpa(nr_sites, local_dim, rank, randstate=rgen)
@@ -1056,6 +1105,31 @@ def test_canonicalization_compression(rgen):
     assert mpo.ranks[0] == 2
 
 
+@pt.mark.parametrize('dtype', pt.MP_TEST_DTYPES)
+@pt.mark.parametrize('nr_sites, local_dim, rank', pt.MP_TEST_PARAMETERS)
+def test_canonicalization_tol(nr_sites, local_dim, rank, rgen, dtype):
+    mpa = factory.random_mpa(nr_sites, local_dim, rank, randstate=rgen,
+                             dtype=dtype, normalized=True)
+    msum = mpa + mpa + mpa
+    if nr_sites > 1:
+        assert max(msum.ranks) == 3 * max(mpa.ranks)
+
+    msum.canonicalize(left='afull', tol=1e-12)
+    assert_correct_normalization(msum, nr_sites - 1, nr_sites)
+    msum.canonicalize(right='afull', tol=1e-12)
+    assert_correct_normalization(msum, 0, 1)
+    assert_mpa_almost_equal(msum, 3 * mpa, full=True)
+    assert msum.ranks == mpa.ranks
+    assert msum.dtype == dtype
+
+    # Random MPAs have full rank, there is nothing to discard
+    mpo = factory.random_mpa(nr_sites, (local_dim, local_dim), rank,
+                             randstate=rgen, dtype=dtype)
+    ranks = mpo.ranks
+    mpo.canonicalize(left='afull', tol=1e-12)
+    assert mpo.ranks == ranks
+
+
 @pt.mark.parametrize('nr_sites, local_dim, rank', pt.MP_TEST_PARAMETERS)
 def test_mult_mpo_scalar_normalization(nr_sites, local_dim, rank, rgen):
     if nr_sites < 2:
@@ -1107,6 +1181,43 @@ def test_singularvals(nr_sites, local_dim, rank, dtype, rgen):
         assert_array_almost_equal(sv[:n_sv], sv2[:n_sv])
 
 
+@pt.mark.parametrize('dtype', pt.MP_TEST_DTYPES)
+@pt.mark.parametrize('nr_sites, local_dim, rank', pt.MP_TEST_PARAMETERS)
+def test_entanglement_profile(nr_sites, local_dim, rank, dtype, rgen):
+    mps = factory.random_mpa(nr_sites, local_dim, rank, randstate=rgen,
+                             dtype=dtype, normalized=True, force_rank=True)
+    mps.canonicalize(left=nr_sites // 2, right=nr_sites // 2 + 1)
+    ltens, cform = [lt.copy() for lt in mps.lt], mps.canonical_form
+    psi = mps.to_array()
+
+    ent, schmidt = mp.entanglement_profile(mps, spectra=3)
+    assert mps.canonical_form == cform
+    for lt, lt2 in zip(mps.lt, ltens):
+        assert_array_equal(lt, lt2)
+    assert ent.shape == (nr_sites - 1,)
+    assert schmidt.shape == (nr_sites - 1, 3)
+    for bond in range(nr_sites - 1):
+        mat = psi.reshape((local_dim**(bond + 1), -1))
+        sv = np.linalg.svd(mat, compute_uv=False)
+        sv /= np.linalg.norm(sv)
+        n_sv = min(len(sv), 3)
+        assert_array_almost_equal(schmidt[bond, :n_sv], sv[:n_sv])
+        p = sv[sv > 1e-14]**2
+        assert_almost_equal(ent[bond], -np.sum(p * np.log(p)))
+
+    if nr_sites > 1:
+        bonds = [nr_sites - 2, 0]
+        ent2 = mp.entanglement_profile(mps, which=bonds, renyi=2)
+        ent_inf = mp.entanglement_profile(mps, which=bonds, renyi=np.inf)
+        for bond, val, val_inf in zip(sorted(bonds), ent2, ent_inf):
+            mat = psi.reshape((local_dim**(bond + 1), -1))
+            p = np.linalg.svd(mat, compute_uv=False)**2
+            p /= np.sum(p)
+            assert_almost_equal(val, -np.log(np.sum(p**2)))
+            assert_almost_equal(val_inf, -np.log(p.max()))
+    assert mp.entanglement_profile(mps, which=[]).shape == (0,)
+
+
 @pt.mark.parametrize('nr_sites, local_dim, rank', pt.MP_TEST_PARAMETERS)
 def test_pad_ranks(nr_sites, local_dim, rank, rgen):
     mps = factory.random_mpa(nr_sites, local_dim, rank, randstate=rgen,
@@ -1147,6 +1258,8 @@ compr_settings = pt.mark.parametrize(
         dict(method='svd', direction='right'),
         dict(method='svd', direction='left', relerr=1e-6),
         dict(method='svd', direction='right', relerr=1e-6),
+        dict(method='svd', direction='left', svdfunc='economical'),
+        dict(method='svd', direction='right', svdfunc='auto'),
         pt.mark.long(dict(method='var', num_sweeps=1, var_sites=1)),
         dict(method='var', num_sweeps=2, var_sites=1),
         pt.mark.long(dict(method='var', num_sweeps=3, var_sites=1)),
@@ -1409,3 +1522,28 @@ def test_compression_trivialsum(nr_sites, local_dims, rank, canonicalize,
     assert_almost_equal(overlap, (norm * factor)**2)
     assert_mpa_almost_equal(compr, factor * mpa, full=True)
     assert (np.array(compr.ranks) <= np.array(mpa.ranks)).all()
+
+
+@pt.mark.parametrize('direction', ['left', 'right'])
+@pt.mark.parametrize('svdfunc', ['randomized', 'auto'])
+def test_compression_svd_sketches(direction, svdfunc, rgen):
+    mpa = factory.random_mpa(5, 3, 4, randstate=rgen, normalized=True)
+    msum = mpa + mpa
+    sketches = {}
+    compr, overlap = msum.compression(rank=4, direction=direction,
+                                      svdfunc=svdfunc, sketches=sketches)
+    assert len(sketches) == 4
+    assert_almost_equal(overlap, 4)
+    assert_mpa_almost_equal(compr, 2 * mpa, full=True)
+
+    # Warm-started compression of a slightly different MPA
+    msum = mpa + 1.01 * mpa
+    compr, overlap = msum.compression(rank=4, direction=direction,
+                                      svdfunc=svdfunc, sketches=sketches)
+    assert_mpa_almost_equal(compr, 2.01 * mpa, full=True)
+
+
+def test_compression_svdfunc_invalid(rgen):
+    mpa = factory.random_mpa(3, 2, 2, randstate=rgen)
+    with pt.raises(ValueError):
+        mpa.compression(rank=2, svdfunc='nonsense')
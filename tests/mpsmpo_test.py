@@ -2,6 +2,8 @@
 #
 from __future__ import absolute_import, division, print_function
 
+import sys
+
 import numpy as np
 import pytest as pt
 from numpy.testing import assert_array_almost_equal
@@ -10,6 +12,7 @@ import mpnum.factory as factory
 import mpnum.mparray as mp
 import mpnum.mpsmpo as mm
 from mpnum import utils
+from six.moves import zip_longest
 
 
 def _get_reductions(red_fun, mpa, max_red_width):
@@ -23,7 +26,8 @@ def _get_reductions(red_fun, mpa, max_red_width):
     return start, stop, red_fun(mpa, startsites=start, stopsites=stop)
 
 
-@pt.mark.parametrize('nr_sites, local_dim, rank', [(6, 2, 4), (4, 3, 5)])
+@pt.mark.parametrize('nr_sites, local_dim, rank',
+                     [(1, 2, 1), (6, 2, 4), (4, 3, 5), (7, 2, 3)])
 def test_pmps_dm_to_array(nr_sites, local_dim, rank, rgen):
 
     pmps = factory.random_mpa(nr_sites, (local_dim, local_dim), rank,
@@ -37,6 +41,21 @@ def test_pmps_dm_to_array(nr_sites, local_dim, rank, rgen):
     assert_array_almost_equal(op2, op)
 
 
+@pt.mark.parametrize('nr_sites, rank, keep',
+                     [(6, 3, (0, 5)), (7, 2, (1, 3, 4)), (5, 4, (0, 1, 4))])
+def test_pmps_dm_to_array_reduction(nr_sites, rank, keep, rgen):
+    # Unequal physical and ancilla dimensions, physical dimension 1 on
+    # traced-out sites in the middle of the chain
+    pmps = factory.random_mpa(nr_sites, (2, 3), rank, dtype=np.complex_,
+                              normalized=True, randstate=rgen)
+    red = mm.pmps_reduction(pmps, keep)
+    op = mm.pmps_to_mpo(red).to_array()
+    op = op.reshape([d for dims in op.shape for d in (dims,) if d > 1])
+    assert_array_almost_equal(mm.pmps_dm_to_array(red), op)
+    assert_array_almost_equal(mm.pmps_dm_to_array(red, True),
+                              utils.local_to_global(op, len(keep)))
+
+
 @pt.mark.benchmark(group='pmps_dm_to_array', min_rounds=2)
 @pt.mark.parametrize('nr_sites, local_dim, rank', [(10, 2, 4), (10, 2, 16)])
 def test_pmps_dm_to_array_fast(nr_sites, local_dim, rank, rgen, benchmark):
@@ -161,6 +180,35 @@ def test_reductions_mpo(nr_sites, local_dim, rank, max_red_width, rgen):
         == nr_sites - max_red_width + 1
 
 
+@pt.mark.parametrize('cache', ['all', 'sqrt', 'stream'])
+def test_reductions_mpo_cache(cache, rgen):
+    nr_sites = 11
+    mpo = factory.random_mpo(nr_sites, 2, 2, randstate=rgen, normalized=True)
+    startsites = [0, 3, 4, 9, 2, 8, 1]
+    stopsites = [5, 6, 5, 11, 3, 10, 11]
+    reds = mm.reductions_mpo(mpo, startsites=startsites, stopsites=stopsites,
+                             cache=cache)
+    reds_ref = mm.reductions_mpo(mpo, startsites=startsites,
+                                 stopsites=stopsites)
+    for red, red_ref in zip(reds, reds_ref):
+        assert_array_almost_equal(red.to_array(), red_ref.to_array())
+
+    with pt.raises(ValueError):
+        next(mm.reductions_mpo(mpo, 2, cache='nonsense'))
+
+
+@pt.mark.parametrize('cache', ['all', 'sqrt', 'stream'])
+def test_reductions_mpo_long_chain(cache):
+    # The former recursive implementation exceeded the recursion limit
+    nr_sites = 5000
+    mpo = mp.MPArray([np.eye(2)[None, ..., None] / 2] * nr_sites)
+    reds = mm.reductions_mpo(mpo, startsites=[0, nr_sites - 2],
+                             stopsites=[2, nr_sites], cache=cache)
+    for red in reds:
+        assert_array_almost_equal(red.to_array_global().reshape((4, 4)),
+                                  np.eye(4) / 4)
+
+
 @pt.mark.parametrize('nr_sites, local_dim, rank, max_red_width',
                      [(6, 2, 4, 3), (4, 3, 5, 2)])
 def test_reductions_pmps(nr_sites, local_dim, rank, max_red_width, rgen):
@@ -188,6 +236,35 @@ def test_reductions_pmps(nr_sites, local_dim, rank, max_red_width, rgen):
         == nr_sites - max_red_width + 1
 
 
+def test_reductions_pmps_sliding(rgen, monkeypatch):
+    nr_sites, width = 8, 3
+    pmps = factory.random_mpa(nr_sites, (2, 2), 3, dtype=np.complex_,
+                              randstate=rgen)
+    pmps /= mp.norm(pmps.copy())
+    assert pmps.canonical_form == (0, nr_sites)
+    ltens = list(pmps.lt)
+    op = mm.pmps_to_mpo(pmps).to_array_global()
+
+    # Count the QR decompositions used for canonicalization
+    nr_qr = [0]
+    qr = mp.qr
+
+    def counting_qr(*args, **kwargs):
+        nr_qr[0] += 1
+        return qr(*args, **kwargs)
+
+    monkeypatch.setattr(mp, 'qr', counting_qr)
+    for start, red in enumerate(mm.reductions_pmps(pmps, width)):
+        traceout = tuple(range(start)) + tuple(range(start + width, nr_sites))
+        assert_array_almost_equal(mm.pmps_to_mpo(red).to_array_global(),
+                                  utils.partial_trace(op, traceout))
+    assert nr_qr[0] == nr_sites - width + nr_sites - width
+
+    # The input has not been modified
+    assert pmps.canonical_form == (0, nr_sites)
+    assert all((lt1 == lt2).all() for lt1, lt2 in zip(ltens, pmps.lt))
+
+
 @pt.mark.parametrize('nr_sites, local_dim, rank, width',
                      [(6, 2, 4, 3), (4, 3, 5, 2)])
 def test_reductions_mps(nr_sites, local_dim, rank, width, rgen):
@@ -200,6 +277,19 @@ def test_reductions_mps(nr_sites, local_dim, rank, width, rgen):
     for red1, red2 in zip(pmps_reds, mpo_reds):
         assert_array_almost_equal(red1.to_array(), red2.to_array())
 
+    pmps_reds = mm.reductions_mps_as_mpo(mps, width, n_workers=2)
+    mpo_reds = mm.reductions_mpo(mpo, width)
+    for red1, red2 in zip_longest(pmps_reds, mpo_reds):
+        assert_array_almost_equal(red1.to_array(), red2.to_array())
+
+
+def test_imap_threads_without_futures(monkeypatch):
+    # Python 2 without the ``futures`` backport
+    monkeypatch.setitem(sys.modules, 'concurrent.futures', None)
+    result = mm._imap(lambda x, y: x * y, range(10), range(1, 11),
+                      n_workers=3)
+    assert list(result) == [x * (x + 1) for x in range(10)]
+
 
 @pt.mark.parametrize('nr_sites, local_dim, rank', pt.MP_TEST_PARAMETERS)
 def test_pmps_to_mpo(nr_sites, local_dim, rank, rgen):
@@ -240,3 +330,233 @@ def test_mps_to_mpo(nr_sites, local_dim, rank, rgen):
     state.shape = (local_dim,) * (2 * nr_sites)
     state2 = mpo.to_array_global()
     assert_array_almost_equal(state, state2)
+
+
+@pt.mark.parametrize(
+    'nr_sites, local_dim, rank, keep',
+    [(6, 2, 3, (1, 2, 4)), (4, 2, 3, (0, 2)), (4, 2, 3, (1, 3)),
+     (4, 2, 3, (1, 2)), (4, 2, 3, (0, 3)), (5, 2, 2, (2,)),
+     (7, 2, 2, (0, 3, 6))])
+def test_reduction_mpo(nr_sites, local_dim, rank, keep, rgen):
+    pmps = factory.random_mpa(nr_sites, (local_dim, local_dim), rank,
+                              dtype=np.complex_, normalized=True,
+                              randstate=rgen)
+    rho = mm.pmps_to_mpo(pmps)
+    traceout = [pos for pos in range(nr_sites) if pos not in keep]
+    red = utils.partial_trace(rho.to_array_global(), traceout)
+
+    red_pmps = mm.reduction_mpo(pmps, keep, 'pmps')
+    assert len(red_pmps) == len(keep)
+    assert max(red_pmps.ranks + (1,)) <= rank**2
+    assert_array_almost_equal(red_pmps.to_array_global(), red)
+    red_mpdo = mm.reduction_mpo(rho, keep[::-1], 'mpdo')
+    assert max(red_mpdo.ranks + (1,)) <= rank**2
+    assert_array_almost_equal(red_mpdo.to_array_global(), red)
+    red_compr = mm.reduction_mpo(pmps, keep, 'pmps', relerr=1e-10)
+    assert_array_almost_equal(red_compr.to_array_global(), red)
+
+    mps = factory.random_mpa(nr_sites, local_dim, rank, dtype=np.complex_,
+                             normalized=True, randstate=rgen)
+    red = utils.partial_trace(mm.mps_to_mpo(mps).to_array_global(), traceout)
+    red_mps = mm.reduction_mpo(mps, keep, 'mps')
+    assert_array_almost_equal(red_mps.to_array_global(), red)
+
+    with pt.raises(ValueError):
+        mm.reduction_mpo(mps, keep, 'mpo')
+
+
+def test_reduction_mpo_distant_sites(rgen):
+    nr_sites, rank = 40, 3
+    mps = factory.random_mpa(nr_sites, 2, rank, dtype=np.complex_,
+                             normalized=True, randstate=rgen)
+    red = mm.reduction_mpo(mps, [2, 20, 37], 'mps')
+    assert red.shape == ((2, 2),) * 3
+    assert red.ranks == (rank**2,) * 2
+    assert abs(mp.trace(red) - 1) < 1e-10
+    # Consistent with the reductions to consecutive sites
+    window = next(mm.reductions_mps_as_mpo(mps, startsites=[20],
+                                         stopsites=[21]))
+    single = mm.reduction_mpo(mps, [20], 'mps')
+    assert_array_almost_equal(single.to_array(), window.to_array())
+
+
+def _dense_correlations(rho, op_a, op_b):
+    nr_sites = len(rho.shape) // 2
+    ldim = rho.shape[0]
+    rho = rho.reshape((ldim**nr_sites,) * 2)
+    corr = np.zeros((nr_sites, nr_sites), dtype=complex)
+    for i in range(nr_sites):
+        for j in range(i, nr_sites):
+            ops = [np.eye(ldim)] * nr_sites
+            ops[i] = op_a
+            ops[j] = np.dot(op_a, op_b) if i == j else op_b
+            corr[i, j] = np.trace(np.dot(rho, utils.mkron(*ops)))
+    return corr
+
+
+@pt.mark.parametrize('nr_sites, local_dim, rank', [(1, 2, 1), (4, 2, 3),
+                                                   (5, 3, 2)])
+def test_correlation_matrix(nr_sites, local_dim, rank, rgen):
+    op_a = factory._zrandn((local_dim, local_dim), randstate=rgen)
+    op_b = factory._zrandn((local_dim, local_dim), randstate=rgen)
+
+    mps = factory.random_mpa(nr_sites, local_dim, rank, dtype=np.complex_,
+                             normalized=True, randstate=rgen)
+    rho = mm.mps_to_mpo(mps)
+    corr = _dense_correlations(rho.to_array_global(), op_a, op_b)
+    assert_array_almost_equal(mm.correlation_matrix(mps, op_a, op_b, 'mps'),
+                              corr)
+    assert_array_almost_equal(mm.correlation_matrix(rho, op_a, op_b, 'mpdo'),
+                              corr)
+
+    pmps = factory.random_mpa(nr_sites, (local_dim, 2), rank,
+                              dtype=np.complex_, normalized=True,
+                              randstate=rgen)
+    rho = mm.pmps_to_mpo(pmps)
+    corr = _dense_correlations(rho.to_array_global(), op_a, op_b)
+    assert_array_almost_equal(mm.correlation_matrix(pmps, op_a, op_b, 'pmps'),
+                              corr)
+    assert_array_almost_equal(mm.correlation_matrix(rho, op_a, op_b, 'mpdo'),
+                              corr)
+
+
+@pt.mark.parametrize('nr_sites, local_dim, rank, width',
+                     [(1, 2, 1, 1), (4, 2, 3, 1), (4, 2, 3, 2), (5, 3, 2, 3)])
+def test_local_expectations(nr_sites, local_dim, rank, width, rgen):
+    dim = local_dim**width
+    ops = [factory._zrandn((dim, dim), randstate=rgen) for _ in range(3)]
+    pmps = factory.random_mpa(nr_sites, (local_dim, 2), rank,
+                              dtype=np.complex_, normalized=True,
+                              randstate=rgen)
+    rho = mm.pmps_to_mpo(pmps)
+    expect = np.array([
+        [np.trace(np.dot(red.to_array_global().reshape((dim, dim)), op))
+         for op in ops]
+        for red in mm.reductions_mpo(rho, width)])
+
+    vals = mm.local_expectations(pmps, ops, width, mode='pmps')
+    assert vals.shape == (nr_sites - width + 1, len(ops))
+    assert_array_almost_equal(vals, expect)
+    vals = mm.local_expectations(rho, ops, width, mode='mpdo')
+    assert_array_almost_equal(vals, expect)
+
+    mps = mm.pmps_to_mps(factory.random_mpa(
+        nr_sites, (local_dim, 1), rank, dtype=np.complex_, normalized=True,
+        randstate=rgen))
+    expect = np.array([
+        [np.trace(np.dot(red.to_array_global().reshape((dim, dim)), op))
+         for op in ops]
+        for red in mm.reductions_mps_as_mpo(mps, width)])
+    vals = mm.local_expectations(mps, ops, width, mode='mps')
+    assert_array_almost_equal(vals, expect)
+
+
+@pt.mark.parametrize('nr_sites, local_dim, rank', [(1, 2, 1), (4, 2, 3),
+                                                   (3, 3, 2)])
+def test_pmps_class(nr_sites, local_dim, rank, rgen):
+    pmps = mm.PMPS(factory.random_mpa(nr_sites, (local_dim, 7), rank,
+                                      dtype=np.complex_, randstate=rgen).lt)
+    rho = mm.pmps_to_mpo(pmps).to_array_global()
+    rho = rho.reshape((local_dim**nr_sites,) * 2)
+    assert abs(pmps.trace() - np.trace(rho)) < 1e-8 * abs(np.trace(rho))
+    assert abs(pmps.dm_norm() - np.linalg.norm(rho)) \
+        < 1e-8 * np.linalg.norm(rho)
+    assert abs(mp.norm(pmps)**2 - pmps.trace()) < 1e-8 * pmps.trace()
+    assert isinstance(pmps.copy(), mm.PMPS)
+    assert isinstance(-2 * pmps.conj(), mm.PMPS)
+    for other in (pmps + pmps, pmps.T, pmps.adj(), pmps.transpose((1, 0)),
+                  pmps.sum(1), pmps.get([0] * nr_sites)):
+        assert type(other) is mp.MPArray
+    if nr_sites > 1:
+        assert all(type(part) is mp.MPArray for part in pmps.split(0))
+
+    # Exact ancilla compression
+    compr = pmps.copy()
+    compr.compress_ancilla()
+    ranks = (1,) + compr.ranks + (1,)
+    for pos, (_, adim) in enumerate(compr.shape):
+        assert adim <= min(7, ranks[pos] * local_dim * ranks[pos + 1])
+    assert_array_almost_equal(mm.pmps_to_mpo(compr).to_array(),
+                              mm.pmps_to_mpo(pmps).to_array())
+    compr.compress_ancilla(rank=1)
+    assert all(adim == 1 for _, adim in compr.shape)
+
+    # Local channel
+    kraus = np.array([factory._zrandn((local_dim, local_dim), randstate=rgen)
+                      for _ in range(2)])
+    site = nr_sites // 2
+    out = pmps.apply_channel(kraus, sites=[site])
+    assert isinstance(out, mm.PMPS)
+    assert out.shape[site] == (local_dim, 14)
+    ops = [np.eye(local_dim)] * nr_sites
+    expect = 0
+    for k in kraus:
+        ops[site] = k
+        kk = utils.mkron(*ops)
+        expect = expect + np.dot(np.dot(kk, rho), kk.conj().T)
+    result = mm.pmps_to_mpo(out).to_array_global().reshape(rho.shape)
+    assert_array_almost_equal(result, expect)
+
+    # Reductions
+    for red, red2 in zip(pmps.reductions(1), mm.reductions_pmps(pmps, 1)):
+        assert isinstance(red, mm.PMPS)
+        assert_array_almost_equal(red.to_mpo().to_array(),
+                                  mm.pmps_to_mpo(red2).to_array())
+    red = pmps.reduction([0, nr_sites - 1])
+    assert isinstance(red, mm.PMPS)
+
+    mps = factory.random_mpa(nr_sites, local_dim, rank, dtype=np.complex_,
+                             randstate=rgen)
+    pure = mm.PMPS.from_mps(mps)
+    assert abs(pure.dm_norm() - pure.trace()) < 1e-8 * pure.trace()
+
+
+@pt.mark.parametrize('nr_sites, local_dim, rank', [(1, 2, 1), (5, 2, 3),
+                                                   (4, 3, 2)])
+def test_pmps_to_mpo_compressed(nr_sites, local_dim, rank, rgen):
+    pmps = factory.random_mpa(nr_sites, (local_dim, 2), rank,
+                              dtype=np.complex_, normalized=True,
+                              randstate=rgen)
+    mpo = mm.pmps_to_mpo(pmps)
+    assert type(mm.pmps_to_mpo(mm.PMPS(pmps.lt))) is mp.MPArray
+
+    compr = mm.pmps_to_mpo(pmps, relerr=1e-12)
+    assert_array_almost_equal(compr.to_array(), mpo.to_array())
+    assert all(c <= r for c, r in zip(compr.ranks, mpo.ranks))
+    assert compr.canonical_form == (0, 1)
+
+    # relerr truncates to the ranks of the exact compression
+    exact = mpo.copy()
+    exact.compress(method='svd', relerr=1e-12)
+    assert compr.ranks == exact.ranks
+
+    # A truncation to a fixed rank is close to the SVD compression
+    exact = mpo.copy()
+    exact.compress(method='svd', rank=2)
+    compr = mm.pmps_to_mpo(pmps, rank=2)
+    assert max(compr.ranks + (1,)) <= 2
+    err = mp.normdist(compr, mpo)
+    assert err <= 1.2 * mp.normdist(exact, mpo) + 1e-10
+
+    mps = factory.random_mpa(nr_sites, local_dim, rank, dtype=np.complex_,
+                             randstate=rgen)
+    assert_array_almost_equal(mm.mps_to_mpo(mps, relerr=1e-12).to_array(),
+                              mm.mps_to_mpo(mps).to_array())
+
+
+@pt.mark.parametrize('compargs', [dict(rank=4), dict(rank=8), dict(rank=12),
+                                  dict(relerr=1e-10), dict(relerr=1e-2)])
+def test_pmps_to_mpo_compressed_vs_compress(compargs, rgen):
+    pmps = factory.random_mpa(8, (2, 2), 4, dtype=np.complex_,
+                              normalized=True, randstate=rgen)
+    mpo = mm.pmps_to_mpo(pmps)
+    exact = mpo.copy()
+    exact.compress(method='svd', **compargs)
+    compr = mm.pmps_to_mpo(pmps, **compargs)
+
+    if 'rank' in compargs:
+        assert max(compr.ranks) <= compargs['rank']
+    else:
+        assert compr.ranks[0] == compr.ranks[-1] == 4
+    err, err_exact = mp.normdist(compr, mpo), mp.normdist(exact, mpo)
+    assert err <= 1.2 * err_exact + 1e-10
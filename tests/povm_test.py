@@ -45,6 +45,10 @@ MPPOVM_PARAM = [
 # method, n_samples
 MPPOVM_SAMPLE_PARAM = [
     ('direct', 100), ('cond', 100), pt.mark.long(('cond', 1000)),
+    ('cond-batch', 100), ('cond-batch', 2500),
+    pt.mark.long(('cond-batch', 40000)),
+    ('canonical', 100), ('canonical', 2500),
+    pt.mark.long(('canonical', 40000)),
     ('direct', 2500), pt.mark.long(('direct', 10000)),
     pt.mark.long(('direct', 40000)), pt.mark.long(('direct', 80000))
 ]
@@ -268,6 +272,89 @@ def test_mppovm_pmf_as_array_pmps(
         assert_array_almost_equal(expect_rho, expect_pmps, err_msg=impl)
 
 
+def test_mppovm_cache(rgen):
+    """Cached values must be reused and discarded if the MP-POVM changes"""
+    nr_sites, local_dim, rank = 4, 2, 3
+    mpp = povm.MPPovm.from_local_povm(povm.pauli_povm(local_dim), nr_sites)
+    pmps = factory.random_mpa(nr_sites, (local_dim, local_dim), rank,
+                              dtype=np.complex_, randstate=rgen, normalized=True)
+    pmap = mpp.probability_map.copy()
+    expect = mpp.pmf_as_array(pmps, 'pmps')
+
+    # Changes of the returned value must not affect the cache
+    changed = mpp.probability_map
+    changed *= 2
+    assert mp.norm(mpp.probability_map - pmap) <= 1e-10
+    assert mpp._conj() is mpp._conj()
+    plan = mpp._pmps_symm_plan(pmps.ranks)
+    mpp.compile_for(pmps.shape, pmps.ranks)
+    assert mpp._pmps_symm_plan(pmps.ranks) is plan
+    assert_array_almost_equal(mpp.pmf_as_array(pmps, 'pmps'), expect)
+
+    # Changing the MP-POVM discards the cache
+    mpp *= 2
+    assert mp.norm(mpp.probability_map - 2 * pmap) <= 1e-10
+    assert mpp._pmps_symm_plan(pmps.ranks) is not plan
+    assert_array_almost_equal(mpp._pmf_as_array_pmps_symm(pmps), 2 * expect)
+
+
+@pt.mark.parametrize('mode', ['mps', 'pmps', 'mpdo'])
+@pt.mark.parametrize('parallel', [dict(n_workers=3), dict(executor='threads')])
+def test_mppovm_block_pmfs_parallel(mode, parallel, rgen):
+    if parallel.get('executor') == 'threads':
+        futures = pt.importorskip('concurrent.futures')
+        parallel = dict(executor=futures.ThreadPoolExecutor(2))
+    nr_sites, width, local_dim = 6, 2, 2
+    mps = factory.random_mps(nr_sites, local_dim, 3, randstate=rgen)
+    mps /= mp.norm(mps)
+    state = {'mps': mps, 'pmps': mpsmpo.mps_to_pmps(mps),
+             'mpdo': mpsmpo.mps_to_mpo(mps)}[mode]
+    mpp = povm.MPPovm.from_local_povm(povm.pauli_povm(local_dim), width)
+    mpps = povm.MPPovmList([mpp] * (nr_sites - width + 1))
+
+    try:
+        pmfs = mpp.block_pmfs_as_array(state, mode, asarray=True)
+        pmfs_par = mpp.block_pmfs_as_array(state, mode, asarray=True,
+                                           **parallel)
+        assert pmfs.shape == (nr_sites - width + 1,) + mpp.nsoutdims
+        assert_array_almost_equal(pmfs_par, pmfs)
+
+        pmfs = mpps.block_pmfs_as_array(state, mode)
+        pmfs_par = mpps.block_pmfs_as_array(state, mode, **parallel)
+        for pmf, pmf_par in zip_longest(pmfs, pmfs_par):
+            assert_array_almost_equal(pmf_par, pmf)
+    finally:
+        if 'executor' in parallel:
+            parallel['executor'].shutdown()
+
+
+@pt.mark.parametrize('mode', ['mps', 'pmps'])
+@pt.mark.parametrize('nr_sites, local_dim, rank', [(1, 2, 1), (4, 2, 3),
+                                                    (5, 3, 2)])
+def test_mppovmlist_pmf_as_array_shared(nr_sites, local_dim, rank, mode, rgen):
+    eps = 1e-10
+    if mode == 'mps':
+        state = factory.random_mps(nr_sites, local_dim, rank, rgen)
+        state /= mp.norm(state)
+    else:
+        state = factory.random_mpa(nr_sites, (local_dim, 2), rank,
+                                   dtype=np.complex_, randstate=rgen,
+                                   normalized=True)
+    paulis = povm.pauli_mpps(nr_sites, local_dim)
+    # Different outcome dimensions, repeated MP-POVMs and unmeasured sites
+    pauli = povm.MPPovm.from_local_povm(povm.pauli_povm(local_dim), 1)
+    mpps = povm.MPPovmList(
+        paulis.mpps + paulis.mpps[:1]
+        + tuple(pauli.embed(nr_sites, pos, local_dim)
+                for pos in range(nr_sites)))
+    expect = list(mpps.pmf_as_array(state, mode, eps, impl='single'))
+    result = list(mpps.pmf_as_array(state, mode, eps))
+    assert len(result) == len(expect)
+    for pmf, pmf_expect in zip(result, expect):
+        assert pmf.shape == pmf_expect.shape
+        assert_array_almost_equal(pmf, pmf_expect)
+
+
 @pt.mark.benchmark(group='pmf_as_array_pmps')
 @pt.mark.parametrize(
     'nr_sites, local_dim, rank, startsite, width', [(10, 2, 16, 0, 10)])
@@ -445,6 +532,117 @@ def test_mppovm_sample(
     assert abs(pmf_exact - pmf_est).max() <= 3 / n_samples**0.5
 
 
+def test_mppovm_sample_to_file(tmpdir, rgen):
+    n_samples, eps = 2500, 1e-10
+    mps = factory.random_mps(3, 2, 2, rgen)
+    mps /= mp.norm(mps.copy())
+    mpp = povm.MPPovm.from_local_povm(povm.pauli_povm(2), 3)
+    assert mpp.packed_dtype() is np.uint8
+    assert povm.pauli_mpp(30, 2).packed_dtype() is None
+
+    seed = rgen.randint(2**31)
+    chunks = list(mpp.sample_iter(np.random.RandomState(seed), mps, n_samples,
+                                  1000, method='cond-batch', mode='mps'))
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, 500]
+    # Same samples as from one call of `sample` per chunk, also with
+    # several workers (which share one process pool)
+    for n_workers in (None, 2):
+        rng = np.random.RandomState(seed)
+        expect = [mpp.sample(rng, mps, size, 'cond-batch', mode='mps',
+                             n_workers=n_workers, block_size=300)
+                  for size in (1000, 1000, 500)]
+        result = mpp.sample_iter(np.random.RandomState(seed), mps, n_samples,
+                                 1000, method='cond-batch', mode='mps',
+                                 n_workers=n_workers, block_size=300)
+        for chunk, chunk_exp in zip_longest(result, expect):
+            assert (chunk == chunk_exp).all()
+    path = str(tmpdir.join('samples.npy'))
+    stored = mpp.sample_to_file(path, np.random.RandomState(seed), mps,
+                                n_samples, 1000, method='cond-batch',
+                                mode='mps')
+    assert stored.dtype == np.uint8 and stored.shape == (n_samples,)
+    samples = mpp.unpack_samples(np.load(path))
+    assert (samples == np.concatenate(chunks)).all()
+    pmf_est = mpp.est_pmf(samples)
+    pmf_exact = mpp.pmf_as_array(mps, 'mps', eps)
+    assert abs(pmf_exact - pmf_est).max() <= 3 / n_samples**0.5
+
+
+@pt.mark.parametrize('method', ['direct', 'cond-batch', 'canonical'])
+def test_mppovm_sample_n_workers(method, rgen):
+    n_samples, eps = 3000, 1e-10
+    mps = factory.random_mps(4, 2, 2, rgen)
+    mps /= mp.norm(mps.copy())
+    mpp = povm.MPPovm.from_local_povm(povm.pauli_povm(2), 4)
+    seed = rgen.randint(2**31)
+    samples = [mpp.sample(np.random.RandomState(seed), mps, n_samples,
+                          method, 1, 'mps', eps=eps, n_workers=n_workers,
+                          block_size=700)
+               for n_workers in (1, 2)]
+    # Independent of the number of workers
+    assert samples[0].dtype == np.uint8
+    assert (samples[0] == samples[1]).all()
+    pmf_est = mpp.est_pmf(samples[1])
+    pmf_exact = mpp.pmf_as_array(mps, 'mps', eps)
+    assert abs(pmf_exact - pmf_est).max() <= 3 / n_samples**0.5
+
+    # The samples are returned in the shared memory of the workers
+    assert not samples[1].flags.owndata
+
+    mppl = povm.MPPovmList([mpp, mpp])
+    s1, s2 = mppl.sample(np.random.RandomState(seed), mps, 100, method,
+                         mode='mps', n_workers=2, block_size=30)
+    assert s1.shape == s2.shape == (100, 4)
+
+
+def test_mppovm_sample_setup_once(monkeypatch, rgen):
+    mps = factory.random_mps(4, 2, 2, rgen)
+    mps /= mp.norm(mps.copy())
+    mpp = povm.MPPovm.from_local_povm(povm.pauli_povm(2), 4)
+    calls = []
+    setup = povm.MPPovm._sample_setup
+
+    def counting_setup(self, *args):
+        calls.append(args)
+        return setup(self, *args)
+
+    monkeypatch.setattr(povm.MPPovm, '_sample_setup', counting_setup)
+    for n_workers in (1, 2):
+        mpp.sample(rgen, mps, 1000, 'cond-batch', mode='mps',
+                   n_workers=n_workers, block_size=10)
+    assert len(calls) == 2
+    chunks = mpp.sample_iter(rgen, mps, 1000, 100, method='cond-batch',
+                             mode='mps', n_workers=2, block_size=10)
+    assert sum(len(chunk) for chunk in chunks) == 1000
+    assert len(calls) == 3
+
+
+@pt.mark.parametrize('method', ['cond-batch', 'canonical'])
+def test_mppovm_sample_entangled_povm(method, rgen):
+    """Sampling from PMPS with a POVM which is not a product POVM"""
+    n_samples, eps = 4000, 1e-10
+    bell = np.array([[1, 0, 0, 1], [1, 0, 0, -1], [0, 1, 1, 0],
+                     [0, 1, -1, 0]]) / 2**0.5
+    # Projectors onto the Bell basis with the outcome split across sites
+    elems = np.einsum('ij,ik->ijk', bell, bell).reshape((2,) * 6)
+    # Axes: outcome 1, outcome 2, row 1, row 2, column 1, column 2
+    elems = elems.transpose(0, 2, 4, 1, 3, 5)
+    bell_mpp = povm.MPPovm.from_array(elems, ndims=3)
+    mpp = mp.chain([povm.MPPovm.from_local_povm(povm.x_povm(2), 1),
+                    bell_mpp, povm.MPPovm.eye([2])])
+    assert max(mpp.ranks) > 1
+    pmps = factory.random_mpa(len(mpp), (2, 2), 2, randstate=rgen,
+                              dtype=np.complex_, normalized=True)
+    pmf_exact = mpp.pmf_as_array(pmps, 'pmps', eps)
+    samples = mpp.sample(rgen, pmps, n_samples, method, 1, 'pmps', eps=eps)
+    pmf_est = mpp.est_pmf(samples)
+    assert abs(pmf_exact - pmf_est).max() <= 3 / n_samples**0.5
+
+    if method == 'canonical':
+        with pt.raises(ValueError):
+            mpp.sample(rgen, mpsmpo.pmps_to_mpo(pmps), 10, method, 1, 'mpdo')
+
+
 @pt.mark.parametrize('method, n_samples', MPPOVM_SAMPLE_PARAM)
 @pt.mark.parametrize('nr_sites, startsite, local_dim', MPPOVM_PARAM)
 def test_mppovm_est_pmf_from(
@@ -493,6 +691,120 @@ def test_mppovm_est_pmf_from(
     assert abs(pmf_exact[given].sum() - est_pmf[given].sum()) <= eps
     assert abs(pmf_exact[given] - est_pmf[given]).max() <= 1 / n_samples**0.5
 
+    est_pmf2, est_n_samples2 = small_mpp.est_pmf_from(
+        mpp, mpp.count_samples(samples))
+    assert est_n_samples2 == n_samples
+    assert (np.isnan(est_pmf2) == ~given).all()
+    assert abs(est_pmf[given] - est_pmf2[given]).max() <= eps
+
+
+def test_mppovm_count_samples_large(rgen):
+    """Sparse counts must work if the outcome space does not fit in memory"""
+    nr_sites = 26
+    mpp = povm.pauli_mpp(nr_sites, 2)
+    assert np.prod(np.array(mpp.nsoutdims, dtype=float)) > 2**63
+    samples = rgen.choice(6, size=(50, nr_sites)).astype(np.uint8)
+    samples = np.concatenate([samples, samples[:20]])
+    out, counts = mpp.count_samples(samples)
+    assert out.shape == (50, nr_sites)
+    assert counts.sum() == 70
+    assert (np.sort(counts) == [1] * 30 + [2] * 20).all()
+    out2, p_est = mpp.est_pmf(samples, sparse=True)
+    assert (out == out2).all()
+    assert abs(p_est - counts / 70).max() <= 1e-15
+
+
+@pt.mark.parametrize('method, n_workers', [('direct', None),
+                                           ('cond-batch', None),
+                                           ('canonical', 2)])
+def test_mppovm_sample_large_outdims(method, n_workers, rgen):
+    """Outcome dimensions larger than 255 use larger sample dtypes"""
+    eps = 1e-10
+    n_samples = 2000
+    # Pauli POVM on four qubits as one site with 6**4 outcomes
+    local = np.asarray(povm.pauli_povm(2))
+    elems = local
+    for _ in range(3):
+        elems = np.einsum('aij,bkl->abikjl', elems, local)
+        dim = elems.shape[2] * elems.shape[3]
+        elems = elems.reshape((-1, dim, dim))
+    mpp = povm.MPPovm.from_local_povm(elems, 2)
+    assert mpp.outdims == (1296, 1296)
+    assert mpp.sample_dtype() is np.uint16
+    mps = factory.random_mps(2, 16, 3, rgen)
+    mps /= mp.norm(mps)
+
+    samples = mpp.sample(rgen, mps, n_samples, method, mode='mps', eps=eps,
+                         n_workers=n_workers, block_size=700)
+    assert samples.dtype == np.uint16
+    assert samples.shape == (n_samples, 2)
+    assert (samples.max(0) > 255).all()
+    packed = mpp.pack_samples(samples)
+    assert (mpp.unpack_samples(packed) == samples).all()
+
+    # Marginal of the first qubit
+    pmf = mpp.pmf_as_array(mps, 'mps', eps).reshape((6, -1)).sum(1)
+    first = np.unravel_index(samples[:, 0], (6,) * 4)[0]
+    est = np.bincount(first, minlength=6) / n_samples
+    assert abs(est - pmf).max() <= 3 / n_samples**0.5
+
+
+def test_mppovm_pack_samples_multiword(rgen):
+    nr_sites = 30
+    mpp = povm.pauli_mpp(nr_sites, 2)
+    assert mpp.packed_dtype() is None
+    samples = rgen.choice(6, size=(100, nr_sites)).astype(np.uint8)
+    samples[50:] = samples[:50]
+    packed = mpp.pack_samples(samples)
+    assert packed.shape == (100, 2)
+    unpacked = mpp.unpack_samples(packed)
+    assert unpacked.dtype == np.uint8
+    assert (unpacked == samples).all()
+    out, counts = mpp.count_samples(samples)
+    assert out.shape == (50, nr_sites)
+    assert (counts == 2).all()
+    out2, counts2 = mpp.count_samples(packed)
+    assert (out2 == out).all() and (counts2 == counts).all()
+    assert (mpp.pack_samples(samples, dtype=np.uint64) == packed).all()
+    assert mpp.pack_samples(samples, dtype=np.uint64).dtype == np.uint64
+
+
+@pt.mark.parametrize('nr_sites, local_dim', [(3, 2), (4, 3)])
+def test_indicator_table(nr_sites, local_dim, rgen):
+    """IndicatorTable must agree with the equivalent Python functions"""
+    eps = 1e-10
+    mps = factory.random_mps(nr_sites, local_dim, 3, rgen)
+    mps.canonicalize()
+    mpp = povm.pauli_mpp(nr_sites, local_dim)
+    samples = mpp.sample(rgen, mps, 500, 'direct', 4, 'mps', eps=eps)
+
+    table = povm.IndicatorTable(mpp.nsoutdims)
+    funs = []
+    for support in [(0,), (0, 2), (1, nr_sites - 1), (0,)]:
+        dims = [mpp.nsoutdims[pos] for pos in support]
+        for _ in range(4):
+            out = np.array([rgen.randint(dim) for dim in dims])
+            table.append(support, out)
+            funs.append(lambda s, out=out, supp=list(support):
+                        (s[:, supp] == out).all(1))
+    # The same function twice
+    table.append((0,), [0])
+    funs.append(lambda s: s[:, 0] == 0)
+    assert len(table) == len(funs)
+
+    fun_out = np.array([f(samples) for f in funs], dtype=float)
+    assert (table.indicators(samples).toarray() == fun_out).all()
+    assert all((f(samples) == g(samples)).all() for f, g in zip(table, funs))
+
+    coeff = rgen.randn(len(funs))
+    for c in (coeff, None):
+        for args in ((mps, 'mps', eps), (samples, None, eps)):
+            fn = mpp.lfun if args[1] == 'mps' else mpp.est_lfun
+            res1 = fn(c, table, *args)
+            res2 = fn(c, funs, *args)
+            assert abs(res1[0] - res2[0]).max() <= eps
+            assert abs(res1[1] - res2[1]).max() <= eps
+
 
 @pt.mark.parametrize('method, n_samples', MPPOVM_SAMPLE_PARAM)
 @pt.mark.parametrize('nr_sites, startsite, local_dim', MPPOVM_PARAM)
@@ -573,6 +885,16 @@ def test_mppovm_est(
     assert abs(sum_ept - sum_ept2) <= eps
     assert abs(sum_var - sum_var2) <= eps
 
+    # Sparse counts must give the same results
+    sparse = mpp.count_samples(samples)
+    assert sparse[1].sum() == n_samples
+    assert (mpp.est_pmf(sparse) == p_est).all()
+    sp_out, p_sparse = mpp.est_pmf(samples, sparse=True)
+    assert (p_sparse == p_est[tuple(sp_out.T)]).all()
+    sum_ept3, sum_var3 = mpp.est_lfun(coeff, funs, sparse, None, eps)
+    assert abs(sum_ept - sum_ept3) <= eps
+    assert abs(sum_var - sum_var3) <= eps
+
 
 @pt.mark.parametrize(
     'method, n_samples', [